@@ -1,3 +1,19 @@
 SHOPPING_CART_HEADER = 'Ваш список покупок:'
 SHOPPING_CART_FOOTER = 'Лучший сайт с рецептами.'
-SHOPPING_CART_FILENAME = 'recipes_shopping_list.txt'
+SHOPPING_CART_FILENAME = 'recipes_shopping_list.{format}'
+
+BATCH_MAX_SIZE = 100
+BATCH_CREATED = 'created'
+BATCH_EXISTS = 'exists'
+BATCH_DELETED = 'deleted'
+BATCH_NOT_ADDED = 'not_added'
+BATCH_NOT_FOUND = 'not_found'
+
+MATCH_MAX_INGREDIENTS = 50
+
+SIMILAR_RECIPES_LIMIT = 10
+
+RECIPE_ORDERING_CHOICES = (
+    ('popular', 'Популярные'),
+    ('trending', 'Набирают популярность'),
+)
@@ -1,38 +1,97 @@
-from django.contrib.auth import get_user_model
+from django import forms
+from django.db.models import Exists, OuterRef
 from django_filters import rest_framework as filters
 
-from recipes.models import Recipe, Tag
+from recipes.models import Cart, Favorite, Recipe
+from recipes.search import search_recipes
+from recipes.tag_map import get_tag_map
+from recipes.tag_mask import filter_by_tags
 
-User = get_user_model()
+from .constants import RECIPE_ORDERING_CHOICES
+
+
+class MultipleIdsField(forms.Field):
+    """Form field for repeated query param of integer ids. Ids are not
+    checked against the database: unknown ids just match nothing."""
+    widget = forms.SelectMultiple
+    default_error_messages = {
+        'invalid': 'Значение должно быть списком целых чисел.',
+    }
+
+    def to_python(self, value):
+        if not value:
+            return []
+        try:
+            return [int(item) for item in value]
+        except (TypeError, ValueError):
+            raise forms.ValidationError(self.error_messages['invalid'],
+                                        code='invalid')
+
+
+class MultipleIdsFilter(filters.Filter):
+    field_class = MultipleIdsField
 
 
 class RecipeFilter(filters.FilterSet):
     """Custom FilterSet that allows filter Recipe views
-    by tags, is_favorited, is_in_shopping_cart and author fields."""
-    tags = filters.ModelMultipleChoiceFilter(
-        field_name='tags__slug',
-        to_field_name='slug',
-        queryset=Tag.objects.all()
+    by tags, is_favorited, is_in_shopping_cart and author fields,
+    search them by text and rank them by precomputed popularity scores.
+
+    Every condition is a bitwise AND on tags mask, an EXISTS subquery
+    or IN on ids, so recipes are never duplicated by joins. Tag slugs are
+    validated and resolved by the cached tag map, without Tag or User
+    queries."""
+    tags = filters.MultipleChoiceFilter(
+        choices=lambda: [(slug, slug) for slug in get_tag_map()],
+        method='tags_filter'
     )
     is_favorited = filters.BooleanFilter(method='is_favorited_filter')
     is_in_shopping_cart = filters.BooleanFilter(
         method='is_in_shopping_cart_filter'
     )
-    author = filters.ModelMultipleChoiceFilter(
-        field_name='author',
-        queryset=User.objects.all()
-    )
+    author = MultipleIdsFilter(method='author_filter')
+    search = filters.CharFilter(method='search_filter')
+    ordering = filters.ChoiceFilter(choices=RECIPE_ORDERING_CHOICES,
+                                    method='ordering_filter')
 
     class Meta:
         model = Recipe
-        fields = ['tags', 'author', 'is_favorited', 'is_in_shopping_cart']
+        fields = ['tags', 'author', 'is_favorited', 'is_in_shopping_cart',
+                  'search', 'ordering']
+
+    def tags_filter(self, queryset, _, value):
+        """Recipes with any of the tags."""
+        if not value:
+            return queryset
+        tag_map = get_tag_map()
+        return filter_by_tags(queryset, [tag_map[slug] for slug in value])
+
+    def author_filter(self, queryset, _, value):
+        if not value:
+            return queryset
+        return queryset.filter(author_id__in=value)
+
+    def _user_rows_filter(self, queryset, model, value):
+        if not value:
+            return queryset
+        if not self.request.user.is_authenticated:
+            return queryset.none()
+        return queryset.filter(Exists(model.objects.filter(
+            recipe=OuterRef('pk'), user=self.request.user)))
 
     def is_favorited_filter(self, queryset, _, value):
-        if value:
-            return queryset.filter(followers__user=self.request.user)
-        return queryset
+        return self._user_rows_filter(queryset, Favorite, value)
 
     def is_in_shopping_cart_filter(self, queryset, _, value):
-        if value:
-            return queryset.filter(in_cart__user=self.request.user)
-        return queryset
+        return self._user_rows_filter(queryset, Cart, value)
+
+    def search_filter(self, queryset, _, value):
+        """Most relevant recipes go first unless ordering is given."""
+        return search_recipes(queryset, value).order_by(
+            '-search_rank', '-pub_date', '-pk')
+
+    def ordering_filter(self, queryset, _, value):
+        """Order by RecipeScore column. Inner join and ordering by score
+        table columns let ranked pages use its indexes."""
+        return queryset.filter(score__isnull=False).order_by(
+            f'-score__{value}', '-score__recipe')
@@ -0,0 +1,61 @@
+import csv
+import json
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+from .constants import SHOPPING_CART_FOOTER, SHOPPING_CART_HEADER
+
+
+class Echo:
+    """File-like object that returns written value instead of storing it."""
+    def write(self, value):
+        return value
+
+
+class PlainTextRenderer(BaseRenderer):
+    """Shopping cart renderer to plain text. Non streaming responses
+    (errors) are rendered as text too."""
+    media_type = 'text/plain'
+    format = 'txt'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict):
+            data = '\n'.join(f'{key}: {value}' for key, value in data.items())
+        return str(data).encode(self.charset)
+
+    def stream(self, ingredients):
+        yield SHOPPING_CART_HEADER
+        for ingredient in ingredients:
+            yield (f'\n{ingredient["ingredient__name"]}'
+                   f' - {ingredient["total"]} '
+                   f'{ingredient["ingredient__measurement_unit"]}')
+        yield f'\n\n{SHOPPING_CART_FOOTER}'
+
+
+class CSVRenderer(PlainTextRenderer):
+    """Shopping cart renderer to CSV."""
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def stream(self, ingredients):
+        writer = csv.writer(Echo())
+        yield writer.writerow(('name', 'measurement_unit', 'amount'))
+        for ingredient in ingredients:
+            yield writer.writerow((ingredient['ingredient__name'],
+                                   ingredient['ingredient__measurement_unit'],
+                                   ingredient['total']))
+
+
+class ShoppingCartJSONRenderer(JSONRenderer):
+    """Shopping cart renderer to JSON array."""
+    def stream(self, ingredients):
+        separator = '['
+        for ingredient in ingredients:
+            yield separator + json.dumps({
+                'name': ingredient['ingredient__name'],
+                'measurement_unit': ingredient['ingredient__measurement_unit'],
+                'amount': ingredient['total']
+            }, ensure_ascii=False)
+            separator = ','
+        yield '[]' if separator == '[' else ']'
@@ -1,11 +1,17 @@
 from django.contrib.auth.password_validation import validate_password
-from django.shortcuts import get_object_or_404
+from django.db import transaction
+from django.db.models import Manager
 from rest_framework import serializers
 
 from core.fields import Base64ImageField
-from recipes.models import Ingredient, IngredientRecipe, Recipe, Tag
+from recipes import fragments, shopping_list, tag_mask
+from recipes.models import (Ingredient, IngredientRecipe, Recipe, Tag,
+                            TagRecipe, load_related)
+from recipes.recipe_matcher import recipe_matcher
 from users.models import Follow, User
 
+from .constants import BATCH_MAX_SIZE, MATCH_MAX_INGREDIENTS
+
 
 class RecipeShortInfoSerializer(serializers.ModelSerializer):
     """Serializer for Recipe model with short information about recipe."""
@@ -14,6 +20,44 @@ class RecipeShortInfoSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'image', 'cooking_time')
 
 
+class RecipeIdsSerializer(serializers.Serializer):
+    """Serializer for list of recipe ids in batch actions."""
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=BATCH_MAX_SIZE
+    )
+
+
+class IngredientSearchQuerySerializer(serializers.Serializer):
+    """Serializer for query params of ingredients search."""
+    name = serializers.CharField(default='', allow_blank=True,
+                                 trim_whitespace=False)
+    limit = serializers.IntegerField(min_value=0, required=False)
+    fuzzy = serializers.BooleanField(default=False)
+
+
+class RecipeMatchQuerySerializer(serializers.Serializer):
+    """Serializer for query params of recipes matching by ingredients."""
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=MATCH_MAX_INGREDIENTS
+    )
+    include = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        default=list,
+        max_length=MATCH_MAX_INGREDIENTS
+    )
+    exclude = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        default=list,
+        max_length=MATCH_MAX_INGREDIENTS
+    )
+    min_coverage = serializers.FloatField(min_value=0, max_value=1,
+                                          default=0)
+
+
 class UserGetRetrieveSerializer(serializers.ModelSerializer):
     """Serializer for user model. Only GET requests."""
     is_subscribed = serializers.SerializerMethodField()
@@ -24,29 +68,35 @@ class UserGetRetrieveSerializer(serializers.ModelSerializer):
                   'is_subscribed')
 
     def get_is_subscribed(self, obj):
-        return Follow.objects.filter(
-            user__username=self.context['request'].user,
-            author__username=obj.username).exists()
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
+        return obj.pk in self._get_subscriptions()
+
+    def _get_subscriptions(self):
+        """Return ids of authors followed by request user. Resolved once
+        and shared by all serializers built for the same request."""
+        if 'subscriptions' not in self.context:
+            user = self.context['request'].user
+            self.context['subscriptions'] = (
+                set(Follow.objects.filter(user=user)
+                    .values_list('author_id', flat=True))
+                if user.is_authenticated else set()
+            )
+        return self.context['subscriptions']
 
 
 class UserSubscribeSerializer(UserGetRetrieveSerializer):
     """Serializer for subscribe actions. Represent user with extra info like
-    user recipes and count of user recipes."""
-    def to_representation(self, instance):
-        data = super().to_representation(instance)
-        recipes = RecipeShortInfoSerializer(instance.recipes, many=True)
-        recipes_limit = self.context['request'].query_params.get(
-            'recipes_limit')
-        if recipes_limit is None:
-            data['recipes'] = recipes.data
-        elif not recipes_limit.isnumeric():
-            raise serializers.ValidationError(
-                {'recipes_limit': 'Параметр должен быть '
-                                  'положительным целым числом.'})
-        else:
-            data['recipes'] = recipes.data[:int(recipes_limit)]
-        data['recipes_count'] = instance.recipes.count()
-        return data
+    user recipes and count of user recipes. Expects queryset prepared by
+    CustomUserViewSet with limited recipes prefetch."""
+    recipes = serializers.SerializerMethodField()
+
+    class Meta(UserGetRetrieveSerializer.Meta):
+        fields = UserGetRetrieveSerializer.Meta.fields + ('recipes',
+                                                          'recipes_count')
+
+    def get_recipes(self, obj):
+        return RecipeShortInfoSerializer(obj.recipes.all(), many=True).data
 
 
 class UserCreateSerializer(serializers.ModelSerializer):
@@ -94,9 +144,9 @@ class IngredientRecipeRetrieveSerializer(serializers.ModelSerializer):
 
 class IngredientRecipeCreateSerializer(serializers.ModelSerializer):
     """Serializer for represent IngredientRecipe model as nested field
-    in POST and PATCH requests."""
-    id = serializers.PrimaryKeyRelatedField(queryset=Ingredient.objects.all(),
-                                            source='ingredient')
+    in POST and PATCH requests. Ingredient ids are validated in bulk
+    by CreateRecipeSerializer."""
+    id = serializers.IntegerField(source='ingredient_id')
 
     class Meta:
         model = IngredientRecipe
@@ -109,63 +159,135 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
     tags = serializers.PrimaryKeyRelatedField(many=True,
                                               queryset=Tag.objects.all())
     ingredients = IngredientRecipeCreateSerializer(many=True, write_only=True)
-    image = Base64ImageField()
+    image = Base64ImageField(required=False)
 
     class Meta:
         model = Recipe
         fields = ('id', 'author', 'tags', 'ingredients', 'name', 'image',
                   'text', 'cooking_time')
 
+    def validate_ingredients(self, ingredients):
+        ingredient_ids = [ingredient['ingredient_id']
+                          for ingredient in ingredients]
+        existing_ids = set(Ingredient.objects.filter(pk__in=ingredient_ids)
+                           .values_list('pk', flat=True))
+        does_not_exist = (serializers.PrimaryKeyRelatedField
+                          .default_error_messages['does_not_exist'])
+        errors, seen_ids = [], set()
+        for ingredient_id in ingredient_ids:
+            if ingredient_id not in existing_ids:
+                errors.append(
+                    {'id': [does_not_exist.format(pk_value=ingredient_id)]})
+            elif ingredient_id in seen_ids:
+                errors.append({'id': ['Ингредиент указан несколько раз.']})
+            else:
+                errors.append({})
+            seen_ids.add(ingredient_id)
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        return ingredients
+
+    def validate(self, attrs):
+        if self.instance is None and 'image' not in attrs:
+            raise serializers.ValidationError(
+                {'image': [self.fields['image'].error_messages['required']]})
+        return attrs
+
+    @staticmethod
+    def _save_tags(recipe, tags, created=False):
+        """Insert and delete only changed TagRecipe rows."""
+        new_ids = {tag.id for tag in tags}
+        old_ids = set() if created else set(
+            recipe.recipe_tags.values_list('tag_id', flat=True))
+        if old_ids - new_ids:
+            recipe.recipe_tags.filter(tag_id__in=old_ids - new_ids).delete()
+        TagRecipe.objects.bulk_create(
+            TagRecipe(recipe=recipe, tag_id=tag_id)
+            for tag_id in new_ids - old_ids
+        )
+
+    @staticmethod
+    def _save_ingredients(recipe, ingredients, created=False):
+        """Insert, update amount and delete only changed
+        IngredientRecipe rows. Return {ingredient_id: delta} changes."""
+        amounts = {ingredient['ingredient_id']: ingredient['amount']
+                   for ingredient in ingredients}
+        changes = dict(amounts)
+        changed, deleted = [], []
+        for row in [] if created else recipe.recipe_ingredients.all():
+            changes[row.ingredient_id] = (changes.get(row.ingredient_id, 0)
+                                          - row.amount)
+            amount = amounts.pop(row.ingredient_id, None)
+            if amount is None:
+                deleted.append(row.pk)
+            elif row.amount != amount:
+                row.amount = amount
+                changed.append(row)
+        if deleted:
+            IngredientRecipe.objects.filter(pk__in=deleted).delete()
+        if changed:
+            IngredientRecipe.objects.bulk_update(changed, ['amount'])
+        IngredientRecipe.objects.bulk_create(
+            IngredientRecipe(recipe=recipe, ingredient_id=ingredient_id,
+                             amount=amount)
+            for ingredient_id, amount in amounts.items()
+        )
+        return changes
+
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
-        recipe = Recipe.objects.create(**validated_data)
-        recipe.tags.set(tags)
-        for ingredient in ingredients:
-            current_ingredient = get_object_or_404(
-                Ingredient,
-                name=ingredient.get('ingredient').name
-            )
-            IngredientRecipe.objects.create(
-                ingredient=current_ingredient,
-                recipe=recipe,
-                amount=ingredient.get('amount')
-            )
+        recipe = Recipe.objects.create(**validated_data,
+                                       tags_mask=tag_mask.mask_of(
+                                           tag.id for tag in tags))
+        self._save_tags(recipe, tags, created=True)
+        self._save_ingredients(recipe, ingredients, created=True)
+        transaction.on_commit(recipe_matcher.invalidate)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
+        shopping_list.lock_recipes([instance.pk])
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
-        instance.tags.clear()
-        instance.ingredients.clear()
         for key, data in validated_data.items():
             setattr(instance, key, data)
+        instance.tags_mask = tag_mask.mask_of(tag.id for tag in tags)
         instance.save()
-        instance.tags.set(tags)
-        for ingredient in ingredients:
-            current_ingredient = get_object_or_404(
-                Ingredient,
-                name=ingredient.get('ingredient').name
-            )
-            IngredientRecipe.objects.create(
-                ingredient=current_ingredient,
-                recipe=instance,
-                amount=ingredient.get('amount')
-            )
+        self._save_tags(instance, tags)
+        shopping_list.change_recipe(
+            instance.pk, self._save_ingredients(instance, ingredients))
+        transaction.on_commit(recipe_matcher.invalidate)
         return instance
 
     def to_representation(self, instance):
         data = super().to_representation(instance)
         data['tags'] = TagSerializer(instance.tags.all(), many=True).data
         data['ingredients'] = IngredientRecipeRetrieveSerializer(
-            instance.recipe_ingredients.all(), many=True).data
+            instance.recipe_ingredients.select_related('ingredient'),
+            many=True).data
         data['is_favorited'] = False
         data['is_in_shopping_cart'] = False
         return data
 
 
+class RecipeListSerializer(serializers.ListSerializer):
+    """List of recipes rendered from fragment cache. Fragments of all
+    recipes are read and missing ones are rendered in bulk."""
+    def to_representation(self, data):
+        recipes = list(data.all() if isinstance(data, Manager) else data)
+        self.child.load_fragments(recipes)
+        return [self.child.to_representation(recipe) for recipe in recipes]
+
+
 class RecipeSerializer(serializers.ModelSerializer):
-    """Serializer for represent Recipe model in GET requests."""
+    """Serializer for represent Recipe model in GET requests.
+
+    Viewer-independent part of representation (fragment) is cached,
+    flags of request user are taken from queryset annotations and merged
+    on top of it. Image is cached as relative URL. Expects recipes with
+    author loaded, tags and ingredients are loaded for cache misses."""
     is_favorited = serializers.BooleanField(default=False)
     is_in_shopping_cart = serializers.BooleanField(default=False)
     author = UserGetRetrieveSerializer(read_only=True)
@@ -178,3 +300,58 @@ class RecipeSerializer(serializers.ModelSerializer):
         fields = ('id', 'tags', 'author', 'ingredients', 'is_favorited',
                   'is_in_shopping_cart', 'name', 'image', 'text',
                   'cooking_time')
+        list_serializer_class = RecipeListSerializer
+
+    def _render_fragment(self, instance):
+        if hasattr(instance, 'author_is_subscribed'):
+            instance.author.is_subscribed = instance.author_is_subscribed
+        data = super().to_representation(instance)
+        data.update(is_favorited=False, is_in_shopping_cart=False,
+                    image=instance.image.url if instance.image else None)
+        data['author']['is_subscribed'] = False
+        return data
+
+    def load_fragments(self, recipes):
+        """Put fragments of recipes to the serializer context: from cache
+        or rendered and cached."""
+        loaded = self.context.setdefault('recipe_fragments', {})
+        loaded.update(fragments.get_many(
+            recipe.pk for recipe in recipes if recipe.pk not in loaded))
+        missing = [recipe for recipe in recipes if recipe.pk not in loaded]
+        if not missing:
+            return
+        load_related(missing)
+        rendered = {recipe.pk: self._render_fragment(recipe)
+                    for recipe in missing}
+        fragments.set_many(rendered)
+        loaded.update(rendered)
+
+    def to_representation(self, instance):
+        flags = {flag: getattr(instance, flag, False)
+                 for flag in ('is_favorited', 'is_in_shopping_cart')}
+        if hasattr(instance, 'author_is_subscribed'):
+            is_subscribed = instance.author_is_subscribed
+        else:
+            is_subscribed = self.fields['author'].get_is_subscribed(
+                instance.author)
+        if instance.pk not in self.context.get('recipe_fragments', {}):
+            self.load_fragments([instance])
+        fragment = self.context['recipe_fragments'][instance.pk]
+        request = self.context.get('request')
+        image = fragment['image']
+        if image and request is not None:
+            image = request.build_absolute_uri(image)
+        return {**fragment, **flags, 'image': image,
+                'author': {**fragment['author'],
+                           'is_subscribed': is_subscribed}}
+
+
+class MatchedRecipeSerializer(RecipeSerializer):
+    """Serializer for recipes matched by ingredients. Expects coverage
+    and missing_count attributes set by RecipeViewSet, which are added
+    to the cached recipe representation."""
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        data['coverage'] = instance.coverage
+        data['missing_count'] = instance.missing_count
+        return data
@@ -6,8 +6,12 @@ from django.contrib.auth import get_user_model
 from rest_framework.authtoken.models import Token
 from rest_framework.test import APIClient, APITestCase, override_settings
 
+from recipes import (counters, facets, fragments, page_cache, search,
+                     shopping_list, tag_map)
+from recipes.ingredient_index import ingredient_index
 from recipes.models import (Cart, Favorite, Ingredient, IngredientRecipe,
                             Recipe, Tag, TagRecipe)
+from recipes.recipe_matcher import recipe_matcher
 from users.models import Follow
 
 User = get_user_model()
@@ -33,11 +37,17 @@ class Fixture(APITestCase):
                                            image=base64img,
                                            text='Nice taste',
                                            cooking_time=10)
-        cls.recipe_ingredient = IngredientRecipe.objects.create(
-            ingredient=cls.ingredient,
-            amount=2,
-            recipe=cls.recipe
-        )
+        # Side effects of recipe rows (tags mask) run on commit.
+        with cls.captureOnCommitCallbacks(execute=True):
+            cls.recipe_ingredient = IngredientRecipe.objects.create(
+                ingredient=cls.ingredient,
+                amount=2,
+                recipe=cls.recipe
+            )
+            cls.recipe_tag = TagRecipe.objects.create(
+                tag=cls.tag,
+                recipe=cls.recipe
+            )
         Token.objects.create(user=cls.user)
         cls.token = Token.objects.get(user__username='TestUser')
         cls.another_user = User.objects.create_user(username='SecondUser',
@@ -45,10 +55,6 @@ class Fixture(APITestCase):
                                                     email='second@2241.ru')
         Token.objects.create(user=cls.another_user)
         cls.another_token = Token.objects.get(user__username='SecondUser')
-        cls.recipe_tag = TagRecipe.objects.create(
-            tag=cls.tag,
-            recipe=cls.recipe
-        )
         cls.favorite = Favorite.objects.create(user=cls.another_user,
                                                recipe=cls.recipe)
         cls.cart = Cart.objects.create(user=cls.another_user,
@@ -79,6 +85,11 @@ class Fixture(APITestCase):
                                                    image=base64img,
                                                    text='well done',
                                                    cooking_time=55)
+        # Carts were filled directly and recipes were bulk created,
+        # so derived data is built by hand.
+        shopping_list.rebuild()
+        counters.reconcile()
+        search.reindex()
 
     @classmethod
     def tearDownClass(cls):
@@ -86,6 +97,12 @@ class Fixture(APITestCase):
         shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
 
     def setUp(self):
+        ingredient_index.invalidate()
+        recipe_matcher.invalidate()
+        tag_map.invalidate()
+        facets.invalidate()
+        fragments.invalidate_all()
+        page_cache.invalidate()
         self.guest_client = APIClient()
         self.authorized_client = APIClient()
         self.authorized_client.credentials(
@@ -0,0 +1 @@
+SELECT "recipes_recipe"."id" FROM "recipes_recipe" WHERE (("recipes_recipe"."tags_mask" & %s) > %s AND "recipes_recipe"."author_id" IN (%s) AND EXISTS(SELECT %s AS "a" FROM "recipes_favorite" U0 WHERE (U0."recipe_id" = ("recipes_recipe"."id") AND U0."user_id" = %s) LIMIT 1) AND EXISTS(SELECT %s AS "a" FROM "recipes_cart" U0 WHERE (U0."recipe_id" = ("recipes_recipe"."id") AND U0."user_id" = %s) LIMIT 1)) ORDER BY "recipes_recipe"."pub_date" DESC, "recipes_recipe"."id" DESC
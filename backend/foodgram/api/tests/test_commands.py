@@ -0,0 +1,53 @@
+from io import StringIO
+
+from django.core.management import CommandError, call_command
+from rest_framework.test import override_settings
+
+from recipes.models import Recipe, ShoppingListItem
+from users.models import User
+
+from .fixtures import TEMP_MEDIA_ROOT, Fixture
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class CommandsTests(Fixture):
+
+    def test_rebuild_shopping_lists(self):
+        """Shopping lists can be verified and rebuilt from carts."""
+        out = StringIO()
+        call_command('rebuild_shopping_lists', '--check', stdout=out)
+        self.assertIn('match', out.getvalue())
+
+        # Drift is detected by check and fixed by rebuild.
+        ShoppingListItem.objects.update(amount=100)
+        ShoppingListItem.objects.create(user=CommandsTests.user,
+                                        ingredient=CommandsTests.ingredient,
+                                        amount=1)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_shopping_lists', '--check',
+                         stdout=out, stderr=StringIO())
+        call_command('rebuild_shopping_lists', stdout=out)
+        call_command('rebuild_shopping_lists', '--check', stdout=out)
+        self.assertFalse(ShoppingListItem.objects.filter(
+            user=CommandsTests.user).exists())
+
+    def test_reconcile_counters(self):
+        """Drifted counters are reported by check and fixed by reconcile."""
+        out = StringIO()
+        call_command('reconcile_counters', '--check', stdout=out)
+        self.assertIn('match', out.getvalue())
+
+        Recipe.objects.filter(pk=CommandsTests.recipe.pk).update(
+            favorites_count=10, in_cart_count=0)
+        User.objects.filter(pk=CommandsTests.another_user.pk).update(
+            followers_count=0)
+        with self.assertRaises(CommandError):
+            call_command('reconcile_counters', '--check',
+                         stdout=out, stderr=StringIO())
+        call_command('reconcile_counters', stdout=out, stderr=StringIO())
+        call_command('reconcile_counters', '--check', stdout=out)
+        recipe = Recipe.objects.get(pk=CommandsTests.recipe.pk)
+        self.assertEqual(recipe.favorites_count, 1)
+        self.assertEqual(recipe.in_cart_count, 1)
+        self.assertEqual(User.objects.get(
+            pk=CommandsTests.another_user.pk).followers_count, 1)
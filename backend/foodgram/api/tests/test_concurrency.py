@@ -0,0 +1,171 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock, skipIf
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import SimpleTestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient, APITransactionTestCase
+
+from core.cache import get_or_set_single_flight
+from recipes import shopping_list
+from recipes.models import (Cart, Favorite, Ingredient, IngredientRecipe,
+                            Recipe, Tag)
+from users.models import Follow
+
+User = get_user_model()
+
+THREADS = 8
+
+
+@skipIf(connection.vendor == 'sqlite',
+        'SQLite locks whole tables of shared in-memory test database, '
+        'parallel writers fail regardless of the code under test. '
+        'Run with DJANGO_TEST_POSTGRES=1.')
+class ConcurrentTogglesTests(APITransactionTestCase):
+    """Parallel add/remove requests get one success and validation
+    errors for the rest, never server errors."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='Racer',
+                                             email='racer@2241.ru')
+        self.author = User.objects.create_user(username='Author',
+                                               email='author@2241.ru')
+        self.recipe = Recipe.objects.create(author=self.author,
+                                            name='Pancakes',
+                                            text='Fast',
+                                            cooking_time=5)
+        self.token = Token.objects.create(user=self.user)
+
+    def _request(self, method, url):
+        return self._call(self.token, method, url)
+
+    @staticmethod
+    def _call(token, method, url, data=None):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+        try:
+            return getattr(client, method)(url, data,
+                                           format='json').status_code
+        finally:
+            connection.close()
+
+    def _race(self, method, url):
+        with ThreadPoolExecutor(THREADS) as executor:
+            return list(executor.map(lambda _: self._request(method, url),
+                                     range(THREADS)))
+
+    def _check_toggle(self, url, manager, success_code):
+        codes = self._race('post', url)
+        self.assertEqual(codes.count(success_code), 1, codes)
+        self.assertEqual(codes.count(status.HTTP_400_BAD_REQUEST),
+                         THREADS - 1, codes)
+        self.assertEqual(manager.objects.count(), 1)
+
+        codes = self._race('delete', url)
+        self.assertEqual(codes.count(status.HTTP_204_NO_CONTENT), 1, codes)
+        self.assertEqual(codes.count(status.HTTP_400_BAD_REQUEST),
+                         THREADS - 1, codes)
+        self.assertEqual(manager.objects.count(), 0)
+
+    def test_parallel_cart_adds_and_ingredients_change(self):
+        """Shopping lists match carts after cart adds racing with
+        a change of the recipe ingredients."""
+        tag = Tag.objects.create(name='Гонка', color='#E26C2D',
+                                 slug='race')
+        flour = Ingredient.objects.create(name='мука', measurement_unit='г')
+        IngredientRecipe.objects.create(recipe=self.recipe, ingredient=flour,
+                                        amount=100)
+        author_token = Token.objects.create(user=self.author)
+        tokens = [Token.objects.create(user=User.objects.create_user(
+            username=f'Buyer{number}', email=f'buyer{number}@2241.ru'))
+            for number in range(THREADS - 1)]
+        cart_url = reverse('api:recipes-shopping-cart',
+                           kwargs={'pk': self.recipe.id})
+        recipe_url = reverse('api:recipes-detail',
+                             kwargs={'pk': self.recipe.id})
+        recipe_data = {'ingredients': [{'id': flour.id, 'amount': 250}],
+                       'tags': [tag.id], 'name': 'Pancakes', 'text': 'Fast',
+                       'cooking_time': 5}
+        calls = [(author_token, 'patch', recipe_url, recipe_data)] + [
+            (token, 'post', cart_url, None) for token in tokens]
+
+        with ThreadPoolExecutor(THREADS) as executor:
+            codes = list(executor.map(lambda call: self._call(*call), calls))
+        self.assertEqual(codes, [status.HTTP_200_OK]
+                         + [status.HTTP_201_CREATED] * len(tokens))
+        self.assertEqual(shopping_list.stored_items(),
+                         shopping_list.live_items())
+
+    def test_parallel_favorite_toggles(self):
+        """Parallel favorite requests don't fail with server errors."""
+        self._check_toggle(
+            reverse('api:recipes-favorite', kwargs={'pk': self.recipe.id}),
+            Favorite, status.HTTP_201_CREATED)
+
+    def test_parallel_shopping_cart_toggles(self):
+        """Parallel shopping cart requests don't fail with server errors."""
+        self._check_toggle(
+            reverse('api:recipes-shopping-cart',
+                    kwargs={'pk': self.recipe.id}),
+            Cart, status.HTTP_201_CREATED)
+
+    def test_parallel_subscribe_toggles(self):
+        """Parallel subscribe requests don't fail with server errors."""
+        self._check_toggle(
+            reverse('api:users-subscribe', kwargs={'id': self.author.id}),
+            Follow, status.HTTP_201_CREATED)
+
+
+class SingleFlightTests(SimpleTestCase):
+    """Only one of parallel callers refills missing or expired value."""
+    key = 'tests:single-flight'
+
+    def setUp(self):
+        cache.delete_many([self.key, f'{self.key}:lock'])
+
+    def test_parallel_callers_compute_once(self):
+        calls = []
+
+        def compute():
+            calls.append(True)
+            time.sleep(0.2)
+            return 'fresh'
+
+        with ThreadPoolExecutor(THREADS) as executor:
+            results = list(executor.map(
+                lambda _: get_or_set_single_flight(self.key, compute, 60),
+                range(THREADS)))
+        self.assertEqual(results, ['fresh'] * THREADS)
+        self.assertEqual(len(calls), 1)
+
+    def test_stale_value_is_served_during_refill(self):
+        compute = mock.Mock(return_value='fresh')
+        cache.set(self.key, (0, 'stale'))
+        cache.add(f'{self.key}:lock', True)
+        self.assertEqual(get_or_set_single_flight(self.key, compute, 60),
+                         'stale')
+        compute.assert_not_called()
+
+        cache.delete(f'{self.key}:lock')
+        self.assertEqual(get_or_set_single_flight(self.key, compute, 60),
+                         'fresh')
+        self.assertEqual(get_or_set_single_flight(self.key, compute, 60),
+                         'fresh')
+        compute.assert_called_once()
+
+    def test_lock_taken_by_another_caller_is_kept(self):
+        lock_key = f'{self.key}:lock'
+
+        def compute():
+            # Lock expired during refill and another caller took it.
+            cache.set(lock_key, 'another')
+            return 'fresh'
+
+        self.assertEqual(get_or_set_single_flight(self.key, compute, 60),
+                         'fresh')
+        self.assertEqual(cache.get(lock_key), 'another')
@@ -1,13 +1,27 @@
+import os
+from datetime import timedelta
+from io import StringIO
+from types import SimpleNamespace
+
+from django.core.management import call_command
+from django.db import connection
+from django.http import QueryDict
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework import status
 from rest_framework.test import override_settings
 
+from api.filters import RecipeFilter
 from foodgram import settings
-from recipes.models import Cart, Favorite, Recipe, TagRecipe
+from recipes import tag_mask
+from recipes.models import (Cart, Favorite, Ingredient, IngredientRecipe,
+                            Recipe, RecipeScore, Tag, TagRecipe)
 from users.models import Follow
 
 from .fixtures import TEMP_MEDIA_ROOT, Fixture
 
+SNAPSHOTS_DIR = os.path.join(os.path.dirname(__file__), 'snapshots')
+
 
 @override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
 class FiltersTests(Fixture):
@@ -95,3 +109,265 @@ class FiltersTests(Fixture):
             url + f'?recipes_limit={test_limit_wrong}')
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertIsNotNone(response.data.get('recipes_limit'))
+
+    def test_ingredient_prefix_search(self):
+        """Ingredient search by name prefix works from in-memory index."""
+        url = reverse('api:ingredients-list')
+        self.guest_client.get(url)
+
+        # Index answers without queries, exact match goes first.
+        with self.assertNumQueries(0):
+            response = self.guest_client.get(url + '?name=Соль')
+        names = [ingredient['name'] for ingredient in response.data]
+        self.assertEqual(names[0], 'соль')
+        self.assertTrue(all(name.startswith('соль') for name in names))
+        self.assertEqual(len(names), Ingredient.objects.filter(
+            name__istartswith='соль').count())
+
+        # Limit param restricts count of results.
+        response = self.guest_client.get(url + '?name=соль&limit=2')
+        self.assertEqual(len(response.data), 2)
+        for limit in ('two', '²', '-1'):
+            response = self.guest_client.get(url, {'name': 'соль',
+                                                   'limit': limit})
+            self.assertEqual(response.status_code,
+                             status.HTTP_400_BAD_REQUEST)
+
+        # Index is rebuilt after ingredients change.
+        Ingredient.objects.create(name='соль ароматная',
+                                  measurement_unit='г')
+        response = self.guest_client.get(url + '?name=соль а')
+        self.assertEqual(response.data[0]['name'], 'соль ароматная')
+
+    def test_ingredient_fuzzy_search(self):
+        """Typo-tolerant search finds ingredients with typos and ё/е."""
+        url = reverse('api:ingredients-list')
+
+        # Prefix search treats ё and е as the same letter.
+        response = self.guest_client.get(url + '?name=ёжевика')
+        self.assertEqual(response.data[0]['name'], 'ежевика')
+
+        # Falls back to fuzzy search when prefix search finds nothing.
+        response = self.guest_client.get(url + '?name=памидор')
+        self.assertEqual(response.data[0]['name'], 'помидоры')
+
+        # Fuzzy mode ranks results by similarity.
+        response = self.guest_client.get(
+            url + '?name=соль марская&fuzzy=1&limit=2')
+        self.assertEqual([ingredient['name'] for ingredient in response.data],
+                         ['соль морская', 'сванская соль'])
+
+        response = self.guest_client.get(url + '?name=qwerty')
+        self.assertEqual(response.data, [])
+
+    def test_popularity_ordering(self):
+        """Recipes can be ranked by popular and trending scores."""
+        url = reverse('api:recipes-list')
+        recent_recipe = Recipe.objects.get(name='Fried chicken №3')
+        Favorite.objects.update(created=timezone.now() - timedelta(days=10))
+        Cart.objects.update(created=timezone.now() - timedelta(days=10))
+        self.authorized_client.post(reverse('api:recipes-favorite',
+                                            kwargs={'pk': recent_recipe.id}))
+        call_command('compute_recipe_scores', stdout=StringIO())
+
+        # Old activity of the recipe weighs more than recent favorite,
+        # but only recent activity counts as trending.
+        response = self.guest_client.get(url + '?ordering=popular')
+        self.assertEqual(response.data['count'], Recipe.objects.count())
+        self.assertEqual(response.data['results'][0]['id'],
+                         FiltersTests.recipe.id)
+        response = self.guest_client.get(url + '?ordering=trending')
+        self.assertEqual(response.data['results'][0]['id'], recent_recipe.id)
+
+        # New recipe has score and unknown ordering is rejected.
+        self.assertTrue(RecipeScore.objects.filter(
+            recipe=Recipe.objects.create(author=FiltersTests.user, name='New',
+                                         text='New', cooking_time=1)
+        ).exists())
+        response = self.guest_client.get(url + '?ordering=name')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_recipe_match(self):
+        """Recipes are matched by ingredients user has and ranked
+        by coverage of recipe ingredients."""
+        url = reverse('api:recipes-match')
+        potato = FiltersTests.ingredient
+        onion, salt = Ingredient.objects.exclude(pk=potato.pk)[:2]
+        soup = Recipe.objects.get(name='Fried chicken №0')
+        for recipe, ingredient in ((FiltersTests.another_recipe, potato),
+                                   (FiltersTests.another_recipe, onion),
+                                   (soup, onion), (soup, salt)):
+            IngredientRecipe.objects.create(recipe=recipe,
+                                            ingredient=ingredient, amount=1)
+
+        def matched(params):
+            query = f'?ingredients={potato.id}&ingredients={onion.id}'
+            response = self.guest_client.get(url + query + params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            return [(recipe['id'], recipe['coverage'],
+                     recipe['missing_count'])
+                    for recipe in response.data['results']]
+
+        self.assertEqual(matched(''), [
+            (FiltersTests.another_recipe.id, 1, 0),
+            (FiltersTests.recipe.id, 1, 0),
+            (soup.id, 0.5, 1)
+        ])
+        # Only the page of recipes is loaded, representations are cached.
+        with self.assertNumQueries(1):
+            self.assertEqual(len(matched('&min_coverage=1')), 2)
+        self.assertEqual(
+            [match[0] for match in matched(f'&exclude={onion.id}')],
+            [FiltersTests.recipe.id])
+        self.assertEqual(
+            [match[0] for match in matched(f'&include={onion.id}')],
+            [FiltersTests.another_recipe.id, soup.id])
+
+        response = self.guest_client.get(url + '?min_coverage=2')
+        self.assertEqual(set(response.data), {'ingredients', 'min_coverage'})
+
+    def test_search_filter(self):
+        """Recipes are searched by name and text, name matches go first."""
+        url = reverse('api:recipes-list')
+        in_text = Recipe.objects.create(author=FiltersTests.user,
+                                        name='Суп', text='Почти борщ',
+                                        cooking_time=30)
+        in_name = Recipe.objects.create(author=FiltersTests.user,
+                                        name='Борщ', text='Свекла и курица',
+                                        cooking_time=60)
+
+        response = self.guest_client.get(url + '?search=БОРЩ')
+        self.assertEqual([recipe['id'] for recipe in response.data['results']],
+                         [in_name.id, in_text.id])
+        response = self.guest_client.get(url + '?search=fried chick')
+        self.assertEqual(response.data['count'],
+                         Recipe.objects.filter(name__startswith='Fried')
+                         .count())
+
+        # Search data follows recipe changes.
+        in_name.name = 'Щи'
+        in_name.save()
+        in_text.delete()
+        response = self.guest_client.get(url + '?search=борщ')
+        self.assertEqual(response.data['count'], 0)
+        response = self.guest_client.get(url + '?search=курица')
+        self.assertEqual([recipe['id'] for recipe in response.data['results']],
+                         [in_name.id])
+        response = self.guest_client.get(url + '?search="')
+        self.assertEqual(response.data['count'], 0)
+
+    def test_filter_sql_snapshot(self):
+        """Filter conditions compile to tags mask AND, EXISTS subqueries
+        and IN on ids without joins. Snapshot of the database vendor
+        is written with UPDATE_SNAPSHOTS=1 env variable."""
+        params = QueryDict(
+            f'tags=test&tags=breakfast&author={FiltersTests.user.id}'
+            f'&is_favorited=1&is_in_shopping_cart=1')
+        queryset = RecipeFilter(
+            params, queryset=Recipe.objects.all(),
+            request=SimpleNamespace(user=FiltersTests.user)).qs
+        sql = queryset.values('pk').query.sql_with_params()[0] + '\n'
+        self.assertNotIn('JOIN', sql)
+        self.assertNotIn('DISTINCT', sql)
+
+        path = os.path.join(SNAPSHOTS_DIR,
+                            f'recipe_filter.{connection.vendor}.sql')
+        if os.getenv('UPDATE_SNAPSHOTS'):
+            with open(path, 'w', encoding='utf-8') as file:
+                file.write(sql)
+        self.assertTrue(os.path.exists(path),
+                        f'Snapshot {path} is missing, run tests with '
+                        f'UPDATE_SNAPSHOTS=1 to write it.')
+        with open(path, encoding='utf-8') as file:
+            self.assertEqual(sql, file.read())
+
+    def test_filters_do_not_query_tags_and_users(self):
+        """Tag slugs are validated by the cached tag map and authors
+        are filtered by ids without loading them."""
+        url = reverse('api:recipes-list') + (
+            f'?tags=test&author={FiltersTests.user.id}')
+        self.authorized_client.get(url)
+        # Token, validators, count and recipes, representations
+        # are cached.
+        with self.assertNumQueries(4):
+            response = self.authorized_client.get(url)
+        self.assertEqual(response.data['count'], 1)
+
+        response = self.guest_client.get(url + '&tags=unknown')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.guest_client.get(url + '&author=me')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_tags_mask(self):
+        """Tags mask follows recipe tags and filter falls back to EXISTS
+        for tags beyond the mask width."""
+        recipe = FiltersTests.recipe
+        breakfast = Tag.objects.get(slug='breakfast')
+        response = self.authorized_client.patch(
+            reverse('api:recipes-detail', kwargs={'pk': recipe.id}), {
+                'ingredients': [{'id': FiltersTests.ingredient.id,
+                                 'amount': 1}],
+                'tags': [breakfast.id, FiltersTests.tag.id],
+                'name': recipe.name,
+                'text': recipe.text,
+                'cooking_time': recipe.cooking_time
+            }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Recipe.objects.get(pk=recipe.id).tags_mask,
+                         tag_mask.mask_of([breakfast.id,
+                                           FiltersTests.tag.id]))
+
+        wide_tag = Tag.objects.create(id=tag_mask.MASK_WIDTH + 1,
+                                      name='Wide', color='#000000',
+                                      slug='wide')
+        TagRecipe.objects.create(tag=wide_tag,
+                                 recipe=FiltersTests.another_recipe)
+        url = reverse('api:recipes-list')
+        response = self.guest_client.get(url + '?tags=wide&tags=breakfast')
+        self.assertEqual(
+            {result['id'] for result in response.data['results']},
+            {recipe.id, FiltersTests.another_recipe.id})
+
+        # Masks follow tags written through m2m managers after commit.
+        with self.captureOnCommitCallbacks(execute=True):
+            breakfast.recipes.clear()
+            FiltersTests.another_recipe.tags.add(FiltersTests.tag)
+        response = self.guest_client.get(url + '?tags=breakfast')
+        self.assertEqual(response.data['count'], 0)
+        response = self.guest_client.get(url + '?tags=test')
+        self.assertEqual(
+            {result['id'] for result in response.data['results']},
+            {recipe.id, FiltersTests.another_recipe.id})
+
+    def test_facets(self):
+        """Facets count recipes of the filter params per tag and cooking
+        time bucket, cached counts are dropped on recipe writes."""
+        url = reverse('api:recipes-facets')
+        response = self.guest_client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], Recipe.objects.count())
+        self.assertEqual(response.data['tags']['test'], 1)
+        self.assertEqual(response.data['tags']['breakfast'], 0)
+        self.assertEqual(response.data['cooking_time'], {
+            'under_15': Recipe.objects.count() - 1,
+            '15_30': 0,
+            '30_60': 1,
+            'over_60': 0,
+        })
+
+        response = self.guest_client.get(url + '?tags=test')
+        self.assertEqual(response.data['count'], 1)
+        self.assertEqual(response.data['cooking_time']['under_15'], 1)
+        with self.assertNumQueries(0):
+            self.guest_client.get(url + '?tags=test')
+
+        response = self.authorized_client_second.get(url + '?is_favorited=1')
+        self.assertEqual(response.data['count'], 3)
+        response = self.guest_client.get(url + '?tags=unknown')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Recipe.objects.get(pk=FiltersTests.another_recipe.pk).delete()
+        response = self.guest_client.get(url)
+        self.assertEqual(response.data['count'], Recipe.objects.count())
+        self.assertEqual(response.data['cooking_time']['30_60'], 0)
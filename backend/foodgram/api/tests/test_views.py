@@ -1,13 +1,21 @@
 import json
+from io import StringIO
+from unittest import mock
 
 from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.authtoken.models import Token
 from rest_framework.test import APIClient, override_settings
 
 from api.constants import SHOPPING_CART_FOOTER, SHOPPING_CART_HEADER
-from recipes.models import Cart, Favorite, Recipe
+from recipes import counters, shopping_list, timeline
+from recipes.models import (Cart, Favorite, Ingredient, IngredientRecipe,
+                            Recipe, RecipeNeighbor, ShoppingListItem, Tag,
+                            TimelineEntry)
 from users.models import Follow
 
 from .fixtures import TEMP_MEDIA_ROOT, Fixture, base64img
@@ -443,7 +451,36 @@ class RecipeTests(Fixture):
                            f' - {RecipeTests.recipe_ingredient.amount} '
                            f'{rec_ing_mes}\n\n'
                            f'{SHOPPING_CART_FOOTER}')
-        self.assertEqual(response.content.decode(), expected_output)
+        self.assertEqual(b''.join(response.streaming_content).decode(),
+                         expected_output)
+
+    def test_api_download_shopping_cart_formats(self):
+        """Shopping list can be downloaded as csv and json."""
+        url = reverse('api:recipes-download-shopping-cart')
+        ingredient = RecipeTests.recipe_ingredient.ingredient
+
+        response = self.authorized_client_second.get(url + '?format=csv')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('recipes_shopping_list.csv',
+                      response['Content-Disposition'])
+        self.assertEqual(
+            b''.join(response.streaming_content).decode(),
+            'name,measurement_unit,amount\r\n'
+            f'{ingredient.name},{ingredient.measurement_unit},'
+            f'{RecipeTests.recipe_ingredient.amount}\r\n')
+
+        response = self.authorized_client_second.get(
+            url, HTTP_ACCEPT='application/json')
+        self.assertEqual(
+            json.loads(b''.join(response.streaming_content)),
+            [{'name': ingredient.name,
+              'measurement_unit': ingredient.measurement_unit,
+              'amount': RecipeTests.recipe_ingredient.amount}])
+
+        # Empty shopping cart is a valid JSON.
+        response = self.authorized_client.get(url + '?format=json')
+        self.assertEqual(json.loads(b''.join(response.streaming_content)),
+                         [])
 
     def test_api_subscriptions_pagination(self):
         """Pagination on subscriptions page works correct."""
@@ -474,3 +511,655 @@ class RecipeTests(Fixture):
         response = self.guest_client.get(url + f'?page=2&limit={limit}')
         self.assertEqual(len(response.data.get('results')),
                          expected_recipe_count)
+
+    def _assert_recipe_list_queries(self, client, expected_queries):
+        """Method to check that recipe feed costs a fixed number of queries
+        regardless of the page size."""
+        url = reverse('api:recipes-list')
+        for limit in (1, Recipe.objects.count()):
+            with self.subTest(limit=limit):
+                with self.assertNumQueries(expected_queries):
+                    response = client.get(url + f'?limit={limit}')
+                self.assertEqual(len(response.data.get('results')), limit)
+
+    def test_api_recipe_list_queries_count(self):
+        """Recipe feed has no N+1 queries for author, tags and ingredients."""
+        for recipe in Recipe.objects.exclude(pk=RecipeTests.recipe.pk):
+            recipe.tags.add(RecipeTests.tag)
+            IngredientRecipe.objects.create(ingredient=RecipeTests.ingredient,
+                                            recipe=recipe,
+                                            amount=3)
+
+        # Validators, count, recipes, tags and ingredients.
+        self._assert_recipe_list_queries(self.guest_client, 5)
+
+        # Representations are cached by guest requests: token
+        # authentication, validators, count and recipes.
+        self._assert_recipe_list_queries(self.authorized_client, 4)
+
+    def test_api_recipe_retrieve_queries_count(self):
+        """Recipe detail is fetched in a fixed number of queries and
+        the author subscription flag comes from annotation."""
+        url = reverse('api:recipes-detail',
+                      kwargs={'pk': RecipeTests.another_recipe.id})
+        with self.assertNumQueries(5):
+            response = self.authorized_client.get(url)
+        self.assertTrue(response.data['author']['is_subscribed'])
+
+        response = self.guest_client.get(url)
+        self.assertFalse(response.data['author']['is_subscribed'])
+
+    def test_api_users_list_queries_count(self):
+        """Users list resolves subscriptions once per request."""
+        url = reverse('api:users-list')
+        with self.assertNumQueries(5):
+            response = self.authorized_client.get(url)
+        users = {user['id']: user for user in response.data['results']}
+        self.assertTrue(users[RecipeTests.another_user.id]['is_subscribed'])
+        self.assertFalse(users[RecipeTests.user.id]['is_subscribed'])
+
+        User.objects.bulk_create(
+            User(username=f'user{number}', email=f'user{number}@2241.ru')
+            for number in range(5))
+        with self.assertNumQueries(5):
+            self.authorized_client.get(url + '?limit=10')
+
+    def test_api_subscriptions_queries_count(self):
+        """Subscriptions page limits recipes in the database and costs
+        a fixed number of queries."""
+        Recipe.objects.bulk_create(
+            Recipe(author=RecipeTests.another_user, name=f'Soup №{number}',
+                   text='Hot', cooking_time=20) for number in range(5))
+        # bulk_create bypasses signals which maintain recipes_count.
+        counters.reconcile()
+        url = reverse('api:users-subscriptions')
+        with self.assertNumQueries(5):
+            response = self.authorized_client.get(url + '?recipes_limit=2')
+        author = response.data['results'][0]
+        self.assertEqual(len(author['recipes']), 2)
+        self.assertEqual(author['recipes'][0]['name'], 'Soup №4')
+        self.assertEqual(author['recipes_count'],
+                         RecipeTests.another_user.recipes.count())
+
+    def test_api_recipe_cursor_pagination(self):
+        """Opt-in keyset pagination walks the whole feed without count."""
+        url = reverse('api:recipes-list')
+        expected_ids = list(Recipe.objects.values_list('id', flat=True))
+
+        with self.assertNumQueries(4):
+            response = self.guest_client.get(url + '?pagination=cursor')
+        self.assertNotIn('count', response.data)
+        self.assertIsNone(response.data['previous'])
+
+        received_ids = [recipe['id'] for recipe in response.data['results']]
+        while response.data['next']:
+            response = self.guest_client.get(response.data['next'])
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            received_ids.extend(
+                recipe['id'] for recipe in response.data['results'])
+        self.assertEqual(received_ids, expected_ids)
+        self.assertIsNotNone(response.data['previous'])
+
+    def test_api_create_recipe_bulk_ingredients(self):
+        """Recipe ingredients are validated and saved in bulk
+        inside a single transaction."""
+        ingredient_ids = list(Ingredient.objects.values_list(
+            'id', flat=True)[:30])
+        data = {
+            'ingredients': [{'id': ingredient_id, 'amount': 5}
+                            for ingredient_id in ingredient_ids],
+            'tags': [RecipeTests.tag.id],
+            'image': base64img,
+            'name': 'Salad',
+            'text': 'Everything in one bowl',
+            'cooking_time': 5
+        }
+        url = reverse('api:recipes-list')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.authorized_client.post(url, data)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertLessEqual(len(queries), 16)
+        self.assertEqual(len(response.data['ingredients']), 30)
+
+        # Non-existent ingredient is reported for its own item.
+        recipes_count = Recipe.objects.count()
+        data['ingredients'].append({'id': 100500, 'amount': 1})
+        response = self.authorized_client.post(url, data)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['ingredients'][:30], [{}] * 30)
+        self.assertIn('id', response.data['ingredients'][30])
+
+        # Failure while saving ingredients doesn't leave a half-written recipe.
+        data['ingredients'].pop()
+        with mock.patch.object(IngredientRecipe.objects, 'bulk_create',
+                               side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                self.authorized_client.post(url, data)
+        self.assertEqual(Recipe.objects.count(), recipes_count)
+
+    def test_api_patch_recipe_applies_diff(self):
+        """Recipe update changes only modified tags and ingredients rows
+        and keeps the unchanged image without decoding."""
+        recipe = RecipeTests.recipe
+        url = reverse('api:recipes-detail', kwargs={'pk': recipe.id})
+        image_name = recipe.image.name
+        tag_row_id = RecipeTests.recipe_tag.id
+        ingredient_row_id = RecipeTests.recipe_ingredient.id
+        new_ingredient = Ingredient.objects.exclude(
+            pk=RecipeTests.ingredient.pk).first()
+        data = {
+            'ingredients': [{'id': RecipeTests.ingredient.id, 'amount': 2}],
+            'tags': [RecipeTests.tag.id],
+            'image': 'http://testserver' + recipe.image.url,
+            'name': recipe.name,
+            'text': 'Fixed typo',
+            'cooking_time': recipe.cooking_time
+        }
+
+        # Text only changes keep related rows and image untouched.
+        response = self.authorized_client.patch(url, data)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.text, 'Fixed typo')
+        self.assertEqual(recipe.image.name, image_name)
+        self.assertEqual(list(recipe.recipe_tags.values_list('id', flat=True)),
+                         [tag_row_id])
+        self.assertEqual(
+            list(recipe.recipe_ingredients.values_list('id', flat=True)),
+            [ingredient_row_id])
+
+        # Image may be omitted, amount is updated in place, new ingredient
+        # is inserted.
+        data.pop('image')
+        data['ingredients'] = [
+            {'id': RecipeTests.ingredient.id, 'amount': 7},
+            {'id': new_ingredient.id, 'amount': 1}
+        ]
+        response = self.authorized_client.patch(url, data)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            IngredientRecipe.objects.get(pk=ingredient_row_id).amount, 7)
+        self.assertEqual(recipe.recipe_ingredients.count(), 2)
+
+        # Removed ingredient is deleted, repeated ingredient is an error.
+        data['ingredients'] = [{'id': new_ingredient.id, 'amount': 1}]
+        response = self.authorized_client.patch(url, data)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(
+            IngredientRecipe.objects.filter(pk=ingredient_row_id).exists())
+        data['ingredients'] *= 2
+        response = self.authorized_client.patch(url, data)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['ingredients'][0], {})
+
+        # Image is still required for new recipes.
+        data['ingredients'].pop()
+        response = self.authorized_client.post(reverse('api:recipes-list'),
+                                               data)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('image', response.data)
+
+    def test_api_shopping_list_aggregate_is_maintained(self):
+        """Shopping list aggregate follows cart and recipe changes."""
+        def assert_in_sync():
+            self.assertEqual(shopping_list.stored_items(),
+                             shopping_list.live_items())
+
+        recipe = RecipeTests.recipe
+        cart_url = reverse('api:recipes-shopping-cart',
+                           kwargs={'pk': recipe.id})
+        other_ingredient = Ingredient.objects.exclude(
+            pk=RecipeTests.ingredient.pk).first()
+
+        self.authorized_client.post(cart_url)
+        assert_in_sync()
+        self.assertEqual(
+            ShoppingListItem.objects.get(user=RecipeTests.user).amount,
+            RecipeTests.recipe_ingredient.amount)
+
+        # Both carts with the recipe follow its ingredients changes.
+        response = self.authorized_client.patch(
+            reverse('api:recipes-detail', kwargs={'pk': recipe.id}), {
+                'ingredients': [{'id': RecipeTests.ingredient.id,
+                                 'amount': 10},
+                                {'id': other_ingredient.id, 'amount': 3}],
+                'tags': [RecipeTests.tag.id],
+                'name': recipe.name,
+                'text': recipe.text,
+                'cooking_time': recipe.cooking_time
+            })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        assert_in_sync()
+        self.assertEqual(ShoppingListItem.objects.filter(
+            ingredient=other_ingredient).count(), 2)
+
+        self.authorized_client.delete(cart_url)
+        assert_in_sync()
+        self.assertFalse(
+            ShoppingListItem.objects.filter(user=RecipeTests.user).exists())
+
+        recipe.delete()
+        assert_in_sync()
+        self.assertFalse(ShoppingListItem.objects.exists())
+
+    def _batch_favorite_or_cart(self, reverse_url, manager, add_queries):
+        """Method for check batch add and delete actions
+        for favorite and cart."""
+        url = reverse(reverse_url)
+        manager.objects.filter(user=RecipeTests.user).delete()
+        manager.objects.create(user=RecipeTests.user,
+                               recipe=RecipeTests.another_recipe)
+        recipe_ids = [RecipeTests.recipe.id, RecipeTests.another_recipe.id,
+                      666]
+
+        # Guest can't use batch actions.
+        response = self.guest_client.post(url, {'ids': recipe_ids})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        # Ids list is validated.
+        response = self.authorized_client.post(url, {'ids': []})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        # Batch add reports status for every id.
+        with self.assertNumQueries(add_queries):
+            response = self.authorized_client.post(url, {'ids': recipe_ids})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [result['status'] for result in response.data['results']],
+            ['created', 'exists', 'not_found'])
+        self.assertEqual(manager.objects.filter(
+            user=RecipeTests.user).count(), 2)
+
+        # Batch delete reports status for every id.
+        manager.objects.filter(user=RecipeTests.user,
+                               recipe=RecipeTests.another_recipe).delete()
+        response = self.authorized_client.delete(url, {'ids': recipe_ids})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [result['status'] for result in response.data['results']],
+            ['deleted', 'not_added', 'not_found'])
+        self.assertFalse(
+            manager.objects.filter(user=RecipeTests.user).exists())
+
+    def test_api_favorite_batch(self):
+        """Authorized user can add and remove many recipes to favorite."""
+        # Token, savepoint, recipes, insert, user version,
+        # recipes counter and release savepoint.
+        self._batch_favorite_or_cart('api:recipes-favorite-batch', Favorite,
+                                     add_queries=7)
+
+    def test_api_shopping_cart_batch(self):
+        """Authorized user can add and remove many recipes to shopping cart
+        and shopping list follows the changes."""
+        # Plus shopping list ingredients and upsert.
+        self._batch_favorite_or_cart('api:recipes-shopping-cart-batch', Cart,
+                                     add_queries=9)
+        self.assertEqual(shopping_list.stored_items(),
+                         shopping_list.live_items())
+
+    def _check_recipe_ids(self, reverse_url, manager, recipe_url):
+        """Method for check recipe id sets with ETag revalidation."""
+        url = reverse(reverse_url)
+        response = self.guest_client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        response = self.authorized_client_second.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            list(response.data),
+            sorted(manager.objects.filter(user=RecipeTests.another_user)
+                   .values_list('recipe_id', flat=True)))
+        etag = response['ETag']
+
+        # Unchanged set is revalidated with user row loaded by auth only.
+        with self.assertNumQueries(1):
+            response = self.authorized_client_second.get(
+                url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # Any change of the set changes ETag.
+        self.authorized_client_second.post(
+            reverse(recipe_url, kwargs={'pk': RecipeTests.another_recipe.id}))
+        response = self.authorized_client_second.get(
+            url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn(RecipeTests.another_recipe.id, response.data)
+        self.assertNotEqual(response['ETag'], etag)
+
+        etag = response['ETag']
+        Recipe.objects.get(pk=RecipeTests.another_recipe.id).delete()
+        response = self.authorized_client_second.get(
+            url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn(RecipeTests.another_recipe.id, response.data)
+
+    def test_api_favorites_ids(self):
+        """User can get ids of favorite recipes."""
+        self._check_recipe_ids('api:users-favorites-ids', Favorite,
+                               'api:recipes-favorite')
+
+    def test_api_cart_ids(self):
+        """User can get ids of recipes in shopping cart."""
+        self._check_recipe_ids('api:users-cart-ids', Cart,
+                               'api:recipes-shopping-cart')
+
+    def test_api_recipe_list_without_user_flags(self):
+        """Feed can skip favorite and shopping cart subqueries."""
+        response = self.authorized_client_second.get(
+            reverse('api:recipes-list') + '?user_flags=0&is_favorited=1')
+        self.assertTrue(response.data['results'])
+        self.assertFalse(any(recipe['is_favorited']
+                             for recipe in response.data['results']))
+
+    def test_api_counters_are_maintained(self):
+        """Recipe and user counters follow favorites, carts, subscriptions,
+        recipes and users changes."""
+        def assert_in_sync():
+            self.assertEqual(counters.reconcile(check=True), [])
+
+        recipe = RecipeTests.another_recipe
+        for reverse_url in ('api:recipes-favorite',
+                            'api:recipes-shopping-cart'):
+            url = reverse(reverse_url, kwargs={'pk': recipe.id})
+            self.authorized_client.post(url)
+            assert_in_sync()
+            self.authorized_client.delete(url)
+            assert_in_sync()
+        self.authorized_client.post(reverse('api:recipes-favorite-batch'),
+                                    {'ids': [recipe.id]})
+        self.assertEqual(
+            Recipe.objects.get(pk=recipe.id).favorites_count, 1)
+
+        url = reverse('api:users-subscribe',
+                      kwargs={'id': RecipeTests.another_user.id})
+        self.authorized_client.delete(url)
+        assert_in_sync()
+        response = self.authorized_client.post(url)
+        self.assertEqual(response.data['recipes_count'],
+                         RecipeTests.another_user.recipes.count())
+        assert_in_sync()
+
+        response = self.authorized_client.post(
+            reverse('api:recipes-list'), {
+                'ingredients': [{'id': RecipeTests.ingredient.id,
+                                 'amount': 1}],
+                'tags': [RecipeTests.tag.id],
+                'image': base64img,
+                'name': 'Counted recipe',
+                'text': 'Text',
+                'cooking_time': 1
+            }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        assert_in_sync()
+        Recipe.objects.get(pk=response.data['id']).delete()
+        assert_in_sync()
+        User.objects.get(pk=RecipeTests.user.pk).delete()
+        assert_in_sync()
+
+    def test_api_similar_and_recommended_recipes(self):
+        """Similar and recommended recipes are read from neighbours
+        computed by users favorites and shopping carts co-occurrence."""
+        recipes = {recipe.name: recipe for recipe in Recipe.objects.all()}
+        for name in ('Fried chicken', 'Fried chicken №2', 'Fried chicken №3'):
+            Favorite.objects.create(user=RecipeTests.user,
+                                    recipe=recipes[name])
+        call_command('compute_recipe_neighbors', stdout=StringIO())
+        neighbors = set(RecipeNeighbor.objects.values_list(
+            'recipe', 'neighbor'))
+        # Blocks sized by products budget give the same neighbours.
+        call_command('compute_recipe_neighbors', '--max-products', '1',
+                     stdout=StringIO())
+        self.assertEqual(set(RecipeNeighbor.objects.values_list(
+            'recipe', 'neighbor')), neighbors)
+
+        recipe = recipes['Fried chicken №3']
+        url = reverse('api:recipes-similar', kwargs={'pk': recipe.id})
+        with self.assertNumQueries(4):
+            response = self.guest_client.get(url)
+        self.assertEqual([similar['id'] for similar in response.data],
+                         [recipes['Fried chicken №2'].id,
+                          recipes['Fried chicken'].id])
+        response = self.guest_client.get(
+            reverse('api:recipes-similar', kwargs={'pk': 666}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.guest_client.get('/api/recipes/abc/similar/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        url = reverse('api:recipes-recommended')
+        response = self.guest_client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        response = self.authorized_client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            {recommended['id'] for recommended in response.data['results']},
+            {recipes[name].id for name in ('Fried chicken №0',
+                                           'Fried chicken №1',
+                                           'Fried chicken №4')})
+
+    def test_api_recipe_feed(self):
+        """Feed shows recipes of followed authors: fanned out on create and
+        subscribe, trimmed on unsubscribe, read from recipes for authors
+        with many followers."""
+        url = reverse('api:recipes-feed')
+        response = self.guest_client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        response = self.authorized_client.get(url)
+        self.assertEqual([recipe['id'] for recipe in response.data['results']],
+                         [RecipeTests.another_recipe.id])
+        response = self.authorized_client_second.get(url)
+        self.assertEqual(response.data['results'], [])
+
+        subscribe_url = reverse('api:users-subscribe',
+                                kwargs={'id': RecipeTests.user.id})
+        self.authorized_client_second.post(subscribe_url)
+        expected_ids = list(Recipe.objects.filter(
+            author=RecipeTests.user).values_list('id', flat=True))
+        response = self.authorized_client_second.get(url)
+        received_ids = [recipe['id'] for recipe in response.data['results']]
+        while response.data['next']:
+            response = self.authorized_client_second.get(
+                response.data['next'])
+            received_ids.extend(
+                recipe['id'] for recipe in response.data['results'])
+        self.assertEqual(received_ids, expected_ids)
+        previous_ids = [recipe['id'] for recipe in response.data['results']]
+        while response.data['previous']:
+            response = self.authorized_client_second.get(
+                response.data['previous'])
+            previous_ids[:0] = [recipe['id']
+                                for recipe in response.data['results']]
+        self.assertEqual(previous_ids, expected_ids)
+        # Recipes of author switched to fan-out-on-read are found in both
+        # timeline and recipes, and are returned once.
+        authors = User.objects.filter(pk=RecipeTests.user.pk)
+        authors.update(timeline_fanout=False)
+        response = self.authorized_client_second.get(
+            url, {'limit': len(expected_ids)})
+        self.assertEqual([recipe['id'] for recipe in response.data['results']],
+                         expected_ids)
+        authors.update(timeline_fanout=True)
+
+        response = self.authorized_client.post(
+            reverse('api:recipes-list'), {
+                'ingredients': [{'id': RecipeTests.ingredient.id,
+                                 'amount': 1}],
+                'tags': [RecipeTests.tag.id],
+                'image': base64img,
+                'name': 'New recipe',
+                'text': 'Fresh',
+                'cooking_time': 5
+            }, format='json')
+        response = self.authorized_client_second.get(url)
+        self.assertEqual(response.data['results'][0]['name'], 'New recipe')
+
+        self.authorized_client_second.delete(subscribe_url)
+        self.assertFalse(TimelineEntry.objects.filter(
+            user=RecipeTests.another_user).exists())
+        response = self.authorized_client_second.get(url)
+        self.assertEqual(response.data['results'], [])
+
+        with mock.patch.object(timeline, 'FANOUT_THRESHOLD', 1):
+            call_command('rebuild_timelines', stdout=StringIO())
+            self.assertFalse(TimelineEntry.objects.exists())
+            response = self.authorized_client.get(url)
+        self.assertEqual([recipe['id'] for recipe in response.data['results']],
+                         [RecipeTests.another_recipe.id])
+
+    def test_api_recipe_feed_delivery_modes(self):
+        """Author reaching the threshold is read on feed requests, also
+        after followers drop below it, until timelines are rebuilt."""
+        url = reverse('api:recipes-feed')
+        author = User.objects.create_user(username='Star',
+                                          email='star@2241.ru')
+        subscribe_url = reverse('api:users-subscribe',
+                                kwargs={'id': author.id})
+        with mock.patch.object(timeline, 'FANOUT_THRESHOLD', 2):
+            self.authorized_client_second.post(subscribe_url)
+            self.assertTrue(User.objects.get(pk=author.pk).timeline_fanout)
+            self.authorized_client.post(subscribe_url)
+            self.assertFalse(User.objects.get(pk=author.pk).timeline_fanout)
+            recipe = Recipe.objects.create(author_id=author.pk, name='Star',
+                                           text='Star', cooking_time=1)
+            self.assertFalse(TimelineEntry.objects.filter(
+                recipe=recipe).exists())
+            self.authorized_client_second.delete(subscribe_url)
+            response = self.authorized_client.get(url)
+            self.assertEqual(response.data['results'][0]['id'], recipe.id)
+
+            call_command('rebuild_timelines', stdout=StringIO())
+            self.assertTrue(User.objects.get(pk=author.pk).timeline_fanout)
+            response = self.authorized_client.get(url)
+            self.assertEqual(response.data['results'][0]['id'], recipe.id)
+
+    def test_api_recipe_fragment_cache(self):
+        """Cached recipe representations are shared by all users with
+        own flags and dropped on recipe, ingredients, tags and author
+        writes."""
+        url = reverse('api:recipes-detail',
+                      kwargs={'pk': RecipeTests.recipe.id})
+        response = self.guest_client.get(url)
+        self.assertFalse(response.data['is_favorited'])
+        self.assertTrue(response.data['image'].startswith('http://'))
+        with self.assertNumQueries(3):
+            response = self.authorized_client_second.get(url)
+        self.assertTrue(response.data['is_favorited'])
+        self.assertTrue(response.data['is_in_shopping_cart'])
+        self.assertFalse(response.data['author']['is_subscribed'])
+
+        Recipe.objects.get(pk=RecipeTests.recipe.id).save()
+        with self.assertNumQueries(4):
+            self.guest_client.get(url)
+        # Rows written outside of the recipe save are handled on commit.
+        row = IngredientRecipe.objects.get(recipe=RecipeTests.recipe)
+        row.amount = 7
+        with self.captureOnCommitCallbacks(execute=True):
+            row.save()
+        response = self.guest_client.get(url)
+        self.assertEqual(response.data['ingredients'][0]['amount'], 7)
+        author = User.objects.get(pk=RecipeTests.user.pk)
+        author.first_name = 'Renamed'
+        author.save()
+        response = self.guest_client.get(url)
+        self.assertEqual(response.data['author']['first_name'], 'Renamed')
+
+    def test_api_anonymous_page_cache(self):
+        """Anonymous recipe pages are cached by normalized query params
+        and dropped on recipe writes."""
+        url = reverse('api:recipes-list')
+        response = self.guest_client.get(url + '?limit=2&page=1')
+        # Only validators are read.
+        with self.assertNumQueries(1):
+            cached = self.guest_client.get(url + '?page=1&limit=2')
+        self.assertEqual(cached.data, response.data)
+        # Token, validators, count and recipes: users are served without
+        # page cache.
+        with self.assertNumQueries(4):
+            self.authorized_client.get(url + '?page=1&limit=2')
+
+        url = reverse('api:recipes-detail',
+                      kwargs={'pk': RecipeTests.another_recipe.id})
+        self.guest_client.get(url)
+        recipe = Recipe.objects.get(pk=RecipeTests.another_recipe.id)
+        recipe.name = 'Shawarma'
+        recipe.save()
+        response = self.guest_client.get(url)
+        self.assertEqual(response.data['name'], 'Shawarma')
+        response = self.guest_client.get(reverse(
+            'api:recipes-detail', kwargs={'pk': 666}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_api_conditional_get(self):
+        """Recipes, tags, ingredients and users are revalidated by ETag
+        and Last-Modified before the main query."""
+        url = reverse('api:recipes-list')
+        response = self.guest_client.get(url)
+        etag = response['ETag']
+        self.assertIn('Last-Modified', response)
+        with self.assertNumQueries(1):
+            response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        response = self.guest_client.get(
+            url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        with self.captureOnCommitCallbacks(execute=True):
+            Recipe.objects.get(pk=RecipeTests.another_recipe.pk).delete()
+        response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # Recipe committed after a newer one changes the list, though
+        # the last update time of recipes stays the same.
+        etag = response['ETag']
+        recipe = Recipe.objects.get(pk=RecipeTests.recipe.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            with mock.patch('django.utils.timezone.now',
+                            return_value=recipe.pub_date):
+                recipe.save()
+        response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        url = reverse('api:recipes-detail',
+                      kwargs={'pk': RecipeTests.recipe.id})
+        response = self.authorized_client.get(url)
+        etag = response['ETag']
+        self.assertNotIn('Last-Modified', response)
+        self.assertIn('private', response['Cache-Control'])
+        # Token authentication and validators.
+        with self.assertNumQueries(2):
+            response = self.authorized_client.get(url,
+                                                  HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.authorized_client.post(reverse(
+            'api:recipes-favorite', kwargs={'pk': RecipeTests.recipe.id}))
+        response = self.authorized_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertTrue(response.data['is_favorited'])
+
+        # Follows of other users don't change responses of the user.
+        url = reverse('api:users-detail',
+                      kwargs={'id': RecipeTests.another_user.id})
+        etag = self.authorized_client.get(url)['ETag']
+        self.authorized_client_second.post(reverse(
+            'api:users-subscribe', kwargs={'id': RecipeTests.user.id}))
+        response = self.authorized_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        subscribe_url = reverse('api:users-subscribe',
+                                kwargs={'id': RecipeTests.another_user.id})
+        for url, change in (
+                (reverse('api:tags-list'),
+                 lambda: Tag.objects.get(pk=RecipeTests.tag.pk).save()),
+                (reverse('api:ingredients-list'),
+                 lambda: Ingredient.objects.create(name='шафран',
+                                                   measurement_unit='г')),
+                (url,
+                 lambda: self.authorized_client.delete(subscribe_url)),
+        ):
+            with self.subTest(url=url):
+                etag = self.authorized_client.get(url)['ETag']
+                response = self.authorized_client.get(
+                    url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code,
+                                 status.HTTP_304_NOT_MODIFIED)
+                with self.captureOnCommitCallbacks(execute=True):
+                    change()
+                response = self.authorized_client.get(
+                    url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
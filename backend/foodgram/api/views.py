@@ -1,43 +1,129 @@
-from django.db.models import Exists, OuterRef, Sum
-from django.http import HttpResponse
+from functools import partial
+
+from django.db import transaction
+from django.db.models import F, OuterRef, Prefetch, Q, Subquery, Sum, Value
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags, quote_etag, urlencode
 from django_filters.rest_framework import DjangoFilterBackend
+from django_filters.utils import translate_validation
 from djoser.views import UserViewSet
-from rest_framework import filters, permissions, serializers, status
+from rest_framework import permissions, serializers, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
 
+from core.conditional import conditional_response, make_etag
+from core.db import bulk_insert_ignore_conflicts, insert_ignore_conflicts
+from core.pagination import (CustomPagination, MergedCursorPagination,
+                             RecipePagination)
 from core.permissions import IsAuthorOrAdminOrReadOnly
-from recipes.models import (Cart, Favorite, Ingredient, IngredientRecipe,
-                            Recipe, Tag)
+from recipes import (counters, facets, page_cache, shopping_list, timeline,
+                     user_state, versions)
+from recipes.ingredient_index import ingredient_index
+from recipes.models import (Cart, Favorite, Ingredient, Recipe, RecipeNeighbor,
+                            ShoppingListItem, Tag)
+from recipes.recipe_matcher import recipe_matcher
 from users.models import Follow, User
 
-from .constants import (SHOPPING_CART_FILENAME, SHOPPING_CART_FOOTER,
-                        SHOPPING_CART_HEADER)
+from .constants import (BATCH_CREATED, BATCH_DELETED, BATCH_EXISTS,
+                        BATCH_NOT_ADDED, BATCH_NOT_FOUND,
+                        SHOPPING_CART_FILENAME, SIMILAR_RECIPES_LIMIT)
 from .filters import RecipeFilter
-from .serializers import (CreateRecipeSerializer, IngredientSerializer,
+from .renderers import CSVRenderer, PlainTextRenderer, ShoppingCartJSONRenderer
+from .serializers import (CreateRecipeSerializer,
+                          IngredientSearchQuerySerializer,
+                          IngredientSerializer, MatchedRecipeSerializer,
+                          RecipeIdsSerializer, RecipeMatchQuerySerializer,
                           RecipeSerializer, RecipeShortInfoSerializer,
                           TagSerializer, UserCreateSerializer,
                           UserGetRetrieveSerializer, UserSubscribeSerializer)
 
+RECIPE_VERSION_TABLES = (versions.INGREDIENTS, versions.RECIPES,
+                         versions.SCORES, versions.TAGS, versions.USERS)
+
+
+def versioned_response(request, render, tables, *parts,
+                       updated_at=None):
+    """Conditional response validated by version counters of tables,
+    extra ETag parts and update time of the resource (subquery read
+    together with the counters). Resource which has no update time
+    (doesn't exist) is rendered without validators. Responses
+    of authenticated users depend on the user, so they are validated
+    by ETag only."""
+    table_versions, tables_updated_at, resource_updated_at = (
+        versions.get_versions(tables, updated_at))
+    if updated_at is not None and resource_updated_at is None:
+        return render()
+    last_modified = max(filter(None, (resource_updated_at,
+                                      tables_updated_at)), default=None)
+    if request.user.is_authenticated:
+        parts += (request.user.pk,)
+        last_modified = None
+    etag = make_etag(*sorted(table_versions.items()), resource_updated_at,
+                     *parts)
+    return conditional_response(request, render, etag, last_modified)
+
+
+def last_recipe_update(**filters):
+    """Subquery of the last update time of recipes."""
+    return Subquery(Recipe.objects.filter(**filters).order_by(
+        '-updated_at').values('updated_at')[:1])
+
 
-class TagViewSet(ReadOnlyModelViewSet):
+class VersionedViewSetMixin:
+    """Conditional GET for list and retrieve actions validated
+    by version counters of version_tables and request user."""
+    version_tables = ()
+
+    def get_user_versions(self, request):
+        """Versions of request user state rendered in responses."""
+        return ()
+
+    def list(self, request, *args, **kwargs):
+        return versioned_response(
+            request, partial(super().list, request, *args, **kwargs),
+            self.version_tables, *self.get_user_versions(request))
+
+    def retrieve(self, request, *args, **kwargs):
+        return versioned_response(
+            request, partial(super().retrieve, request, *args, **kwargs),
+            self.version_tables, *self.get_user_versions(request))
+
+
+class TagViewSet(VersionedViewSetMixin, ReadOnlyModelViewSet):
     """ViewSet for Tag model, only GET requests."""
+    version_tables = (versions.TAGS,)
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (permissions.AllowAny,)
     pagination_class = None
 
 
-class IngredientViewSet(ReadOnlyModelViewSet):
-    """ViewSet for Ingredient model, only GET requests."""
+class IngredientViewSet(VersionedViewSetMixin, ReadOnlyModelViewSet):
+    """ViewSet for Ingredient model, only GET requests.
+    List is served from in-memory index of ingredient names: prefix search
+    with fallback to typo-tolerant search (forced by fuzzy param).
+    List is validated by version of the index, so autocomplete requests
+    don't reach the database."""
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = (permissions.AllowAny,)
-    filter_backends = (filters.SearchFilter,)
-    search_fields = ('^name',)
     pagination_class = None
+    version_tables = (versions.INGREDIENTS,)
+
+    def list(self, request, *args, **kwargs):
+        return conditional_response(request, partial(self._search, request),
+                                    make_etag(ingredient_index.version()))
+
+    def _search(self, request):
+        serializer = IngredientSearchQuerySerializer(
+            data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        query = serializer.validated_data
+        return Response(ingredient_index.search(
+            query['name'], query.get('limit'), query['fuzzy']))
 
 
 class RecipeViewSet(ModelViewSet):
@@ -46,28 +132,68 @@ class RecipeViewSet(ModelViewSet):
     permission_classes = (IsAuthorOrAdminOrReadOnly,)
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
+    pagination_class = RecipePagination
+    lookup_value_regex = r'\d+'
     http_method_names = ['get', 'post', 'patch', 'delete']
 
     def get_queryset(self):
-        if self.request.user.is_authenticated:
-            queryset = Recipe.objects.annotate(
-                is_favorited=Exists(
-                    Favorite.objects.filter(
-                        user=self.request.user,
-                        recipe__pk=OuterRef('pk')
-                    )
-                ),
-                is_in_shopping_cart=Exists(
-                    Cart.objects.filter(
-                        user=self.request.user,
-                        recipe__pk=OuterRef('pk')
-                    )
-                )
-            )
-        else:
-            queryset = Recipe.objects.all()
+        queryset = Recipe.objects.with_user_flags(
+            self.request.user,
+            recipe_flags=self.request.query_params.get('user_flags') != '0'
+        )
+        if self.action in ('list', 'retrieve', 'match', 'similar',
+                           'recommended', 'feed'):
+            # Tags and ingredients are loaded by RecipeSerializer
+            # only for recipes missing in fragment cache.
+            queryset = queryset.select_related('author')
         return queryset
 
+    def _anonymous_cached(self, handler, request, *args, **kwargs):
+        """Serve response data of anonymous users from page cache keyed
+        by URL with sorted query params."""
+        if request.user.is_authenticated:
+            return handler(request, *args, **kwargs)
+        params = urlencode(sorted(
+            (name, value) for name, values in request.query_params.lists()
+            for value in values))
+        status_code, data = page_cache.get_or_render(
+            f'{request.build_absolute_uri(request.path)}?{params}',
+            lambda: self._render_page(handler, request, *args, **kwargs))
+        return Response(data, status=status_code)
+
+    @staticmethod
+    def _render_page(handler, request, *args, **kwargs):
+        response = handler(request, *args, **kwargs)
+        return response.status_code, response.data
+
+    @staticmethod
+    def _user_versions(request):
+        """Versions of request user flags rendered with recipes."""
+        if not request.user.is_authenticated:
+            return ()
+        return tuple(user_state.get_version(model, request.user)
+                     for model in (Favorite, Cart, Follow))
+
+    def list(self, request, *args, **kwargs):
+        """Recipe lists are validated by the last update of all recipes,
+        so 304 doesn't need the filtered query."""
+        return versioned_response(
+            request,
+            partial(self._anonymous_cached, super().list, request, *args,
+                    **kwargs),
+            RECIPE_VERSION_TABLES, *self._user_versions(request),
+            updated_at=last_recipe_update()
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        render = partial(self._anonymous_cached, super().retrieve, request,
+                         *args, **kwargs)
+        return versioned_response(
+            request, render, RECIPE_VERSION_TABLES,
+            *self._user_versions(request),
+            updated_at=last_recipe_update(pk=kwargs[self.lookup_field])
+        )
+
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
@@ -79,36 +205,118 @@ class RecipeViewSet(ModelViewSet):
             return CreateRecipeSerializer
         if self.action in ('shopping_cart', 'favorite'):
             return RecipeShortInfoSerializer
+        if self.action == 'match':
+            return MatchedRecipeSerializer
         return self.serializer_class
 
     def partial_update(self, request, *args, **kwargs):
         kwargs['partial'] = False
         return self.update(request, *args, **kwargs)
 
+    @staticmethod
+    def _recipes_added(model, user, recipe_ids):
+        """Hook for side effects of adding recipes to Favorite or Cart.
+        Runs in the same transaction as the insert."""
+        if not recipe_ids:
+            return
+        user_state.bump_version(model, [user.id])
+        counters.recipes_changed(model, recipe_ids, 1)
+        if model is Cart:
+            shopping_list.add_recipes(user.id, recipe_ids)
+
+    @staticmethod
+    def _recipes_removed(model, user, recipe_ids):
+        """Hook for side effects of removing recipes from Favorite or Cart.
+        Runs in the same transaction as the delete."""
+        if not recipe_ids:
+            return
+        user_state.bump_version(model, [user.id])
+        counters.recipes_changed(model, recipe_ids, -1)
+        if model is Cart:
+            shopping_list.remove_recipes(user.id, recipe_ids)
+
+    @transaction.atomic
     def _recipe_processing(self, request, model, pk):
-        recipe = get_object_or_404(Recipe, pk=pk)
-        favorite_object = model.objects.filter(user=request.user,
-                                               recipe=recipe)
+        """Add or remove recipe to Favorite or Cart with single
+        conflict-tolerant insert or single delete. Cart changes lock
+        the recipe (see shopping_list)."""
+        recipes = Recipe.objects.all()
+        if model is Cart:
+            recipes = recipes.select_for_update()
         if request.method == 'POST':
-            if favorite_object.exists():
+            recipe = get_object_or_404(recipes, pk=pk)
+            if not insert_ignore_conflicts(model, user=request.user,
+                                           recipe=recipe):
                 raise serializers.ValidationError(
                     {
                         'errors': 'Рецепт уже добавлен.'
                     }
                 )
-            model.objects.create(user=request.user, recipe=recipe)
+            self._recipes_added(model, request.user, [recipe.id])
             return Response(self.get_serializer(recipe).data,
                             status=status.HTTP_201_CREATED)
 
-        if not favorite_object.exists():
+        if model is Cart:
+            shopping_list.lock_recipes([pk])
+        deleted, _ = model.objects.filter(user=request.user,
+                                          recipe_id=pk).delete()
+        if not deleted:
+            get_object_or_404(Recipe, pk=pk)
             raise serializers.ValidationError(
                 {
                     'errors': "Данный рецепт не добавлен."
                 }
             )
-        favorite_object.delete()
+        self._recipes_removed(model, request.user, [int(pk)])
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @staticmethod
+    def _existing_recipes(model, recipe_ids):
+        """Return ids of existing recipes. Cart changes lock the recipes
+        (see shopping_list)."""
+        if model is Cart:
+            return shopping_list.lock_recipes(recipe_ids)
+        return set(Recipe.objects.filter(pk__in=recipe_ids)
+                   .values_list('pk', flat=True).order_by())
+
+    @transaction.atomic
+    def _batch_processing(self, request, model):
+        """Add or remove list of recipes to Favorite or Cart with single
+        bulk insert or delete. Return status for every requested id."""
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        recipe_ids = serializer.validated_data['ids']
+
+        if request.method == 'POST':
+            existing_ids = self._existing_recipes(model, recipe_ids)
+            new_ids = set(bulk_insert_ignore_conflicts(
+                model,
+                (model(user=request.user, recipe_id=recipe_id)
+                 for recipe_id in existing_ids),
+                returning='recipe'
+            ))
+            self._recipes_added(model, request.user, new_ids)
+            statuses = {**dict.fromkeys(existing_ids, BATCH_EXISTS),
+                        **dict.fromkeys(new_ids, BATCH_CREATED)}
+        else:
+            self._existing_recipes(model, recipe_ids)
+            user_objects = model.objects.filter(user=request.user,
+                                                recipe_id__in=recipe_ids)
+            deleted_ids = set(user_objects.select_for_update()
+                              .values_list('recipe_id', flat=True))
+            user_objects.filter(recipe_id__in=deleted_ids).delete()
+            self._recipes_removed(model, request.user, deleted_ids)
+            existing_ids = set(
+                Recipe.objects.filter(pk__in=set(recipe_ids) - deleted_ids)
+                .values_list('pk', flat=True).order_by())
+            statuses = {**dict.fromkeys(existing_ids, BATCH_NOT_ADDED),
+                        **dict.fromkeys(deleted_ids, BATCH_DELETED)}
+        return Response({'results': [
+            {'id': recipe_id,
+             'status': statuses.get(recipe_id, BATCH_NOT_FOUND)}
+            for recipe_id in recipe_ids
+        ]})
+
     @action(methods=['post', 'delete'], detail=True)
     def favorite(self, request, *args, **kwargs):
         return self._recipe_processing(request, Favorite, kwargs['pk'])
@@ -117,37 +325,138 @@ class RecipeViewSet(ModelViewSet):
     def shopping_cart(self, request, *args, **kwargs):
         return self._recipe_processing(request, Cart, kwargs['pk'])
 
-    @action(detail=False, permission_classes=[permissions.IsAuthenticated])
+    @action(methods=['post', 'delete'], detail=False,
+            url_path='favorite/batch')
+    def favorite_batch(self, request):
+        return self._batch_processing(request, Favorite)
+
+    @action(methods=['post', 'delete'], detail=False,
+            url_path='shopping_cart/batch')
+    def shopping_cart_batch(self, request):
+        return self._batch_processing(request, Cart)
+
+    def _ranked_recipes(self, recipe_ids):
+        """Load recipes with the action queryset keeping order of ids.
+        Ids of deleted recipes are skipped."""
+        recipes = self.get_queryset().in_bulk(recipe_ids)
+        return [recipes[recipe_id] for recipe_id in recipe_ids
+                if recipe_id in recipes]
+
+    @action(detail=False, permission_classes=[permissions.IsAuthenticated],
+            pagination_class=MergedCursorPagination)
+    def feed(self, request):
+        """Recipes of followed authors, newest first. Pages are positions
+        read from the user timeline, recipes are loaded by ids."""
+        page = self.paginate_queryset(partial(timeline.feed, request.user))
+        recipes = self._ranked_recipes([recipe_id for _, recipe_id in page])
+        return self.get_paginated_response(
+            self.get_serializer(recipes, many=True).data)
+
+    @action(detail=False)
+    def facets(self, request):
+        """Numbers of recipes matching the filter params per tag and
+        cooking time bucket. Counts are cached by filter signature, except
+        for user favorites and shopping cart filters: user rows changes
+        don't invalidate the cache."""
+        filterset = RecipeFilter(request.query_params,
+                                 queryset=Recipe.objects.all(),
+                                 request=request)
+        if not filterset.is_valid():
+            raise translate_validation(filterset.errors)
+        signature = {name: sorted(value) if isinstance(value, list) else value
+                     for name, value in filterset.form.cleaned_data.items()
+                     if value}
+        if (signature.get('is_favorited')
+                or signature.get('is_in_shopping_cart')):
+            return Response(facets.count_facets(filterset.qs))
+        return Response(facets.get_facets(filterset.qs, signature))
+
+    @action(detail=False, pagination_class=CustomPagination)
+    def match(self, request):
+        """Recipes which can be cooked from given ingredients, ranked by
+        share of recipe ingredients covered. Candidates are ranked by the
+        in-memory recipe matcher, only the page of recipes is loaded."""
+        serializer = RecipeMatchQuerySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        page = self.paginate_queryset(
+            recipe_matcher.match(**serializer.validated_data))
+        matches = {recipe_id: (matched, total)
+                   for recipe_id, matched, total in page}
+        recipes = self._ranked_recipes(list(matches))
+        for recipe in recipes:
+            matched, total = matches[recipe.pk]
+            recipe.coverage = round(matched / total, 4)
+            recipe.missing_count = total - matched
+        return self.get_paginated_response(
+            self.get_serializer(recipes, many=True).data)
+
+    @action(detail=True)
+    def similar(self, request, pk=None):
+        """Recipes most often favorited or added to shopping cart together
+        with the recipe. Read from precomputed RecipeNeighbor rows."""
+        neighbor_ids = list(
+            RecipeNeighbor.objects.filter(recipe_id=pk)
+            .order_by('-score', '-neighbor')
+            .values_list('neighbor_id', flat=True)[:SIMILAR_RECIPES_LIMIT])
+        if not neighbor_ids:
+            get_object_or_404(Recipe, pk=pk)
+        return Response(self.get_serializer(
+            self._ranked_recipes(neighbor_ids), many=True).data)
+
+    @action(detail=False, permission_classes=[permissions.IsAuthenticated],
+            pagination_class=CustomPagination)
+    def recommended(self, request):
+        """Neighbours of user favorites and shopping cart recipes, which are
+        not added yet, ranked by summed similarity."""
+        favorites = Favorite.objects.filter(user=request.user).values('recipe')
+        cart = Cart.objects.filter(user=request.user).values('recipe')
+        ranked_ids = (
+            RecipeNeighbor.objects
+            .filter(Q(recipe__in=favorites) | Q(recipe__in=cart))
+            .exclude(neighbor__in=favorites).exclude(neighbor__in=cart)
+            .values('neighbor').annotate(total=Sum('score'))
+            .order_by('-total', '-neighbor')
+            .values_list('neighbor', flat=True)
+        )
+        page = self.paginate_queryset(ranked_ids)
+        return self.get_paginated_response(self.get_serializer(
+            self._ranked_recipes(page), many=True).data)
+
+    @action(detail=False, permission_classes=[permissions.IsAuthenticated],
+            renderer_classes=(PlainTextRenderer, CSVRenderer,
+                              ShoppingCartJSONRenderer))
     def download_shopping_cart(self, request):
-        ingredients_for_recipes = IngredientRecipe.objects.select_related(
-            'ingredient', 'recipe')
-        user_cart = ingredients_for_recipes.filter(
-            recipe__in_cart__user=request.user)
-        user_cart_ingredients = user_cart.values(
-            'ingredient__name',
-            'ingredient__measurement_unit').annotate(total=Sum('amount'))
-
-        text = [SHOPPING_CART_HEADER]
-        text.extend([f'{ingredient["ingredient__name"]}'
-                     f' - {ingredient["total"]} '
-                     f'{ingredient["ingredient__measurement_unit"]}'
-                     for ingredient in user_cart_ingredients])
-        text.append(f'\n{SHOPPING_CART_FOOTER}')
-        text = '\n'.join(text)
-
-        response = HttpResponse(text, content_type='text/plain')
-        response['Content-Disposition'] = (
-            f'attachment; filename={SHOPPING_CART_FILENAME}')
+        """Stream shopping list in txt, csv or json format
+        (chosen by format param or Accept header)."""
+        user_cart_ingredients = ShoppingListItem.objects.filter(
+            user=request.user
+        ).values(
+            'ingredient__name', 'ingredient__measurement_unit',
+            total=F('amount')
+        ).order_by('ingredient__name')
+
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(
+            renderer.stream(user_cart_ingredients.iterator()),
+            content_type=f'{renderer.media_type}; charset=utf-8')
+        filename = SHOPPING_CART_FILENAME.format(format=renderer.format)
+        response['Content-Disposition'] = f'attachment; filename={filename}'
         return response
 
 
-class CustomUserViewSet(UserViewSet):
+class CustomUserViewSet(VersionedViewSetMixin, UserViewSet):
     """Extended djoser user viewset with extra actions
     (subscribe and subscriptions).
     """
     queryset = User.objects.all()
     serializer_class = UserGetRetrieveSerializer
     http_method_names = ['get', 'post']
+    version_tables = (versions.USERS,)
+
+    def get_user_versions(self, request):
+        if not request.user.is_authenticated:
+            return ()
+        return (user_state.get_version(Follow, request.user),)
 
     def get_serializer_class(self):
         if self.action in ('subscriptions', 'subscribe'):
@@ -156,9 +465,67 @@ class CustomUserViewSet(UserViewSet):
             return UserCreateSerializer
         return super().get_serializer_class()
 
+    def _get_recipes_limit(self):
+        recipes_limit = self.request.query_params.get('recipes_limit')
+        if recipes_limit is None:
+            return None
+        if not recipes_limit.isnumeric():
+            raise serializers.ValidationError(
+                {'recipes_limit': 'Параметр должен быть '
+                                  'положительным целым числом.'})
+        return int(recipes_limit)
+
+    def _with_recipes(self, queryset):
+        """Prefetch only recipes_limit latest recipes of each author."""
+        recipes = Recipe.objects.all()
+        recipes_limit = self._get_recipes_limit()
+        if recipes_limit is not None:
+            recipes = recipes.filter(pk__in=Subquery(
+                Recipe.objects.filter(author=OuterRef('author'))
+                .values('pk')[:recipes_limit]
+            ))
+        return queryset.annotate(
+            is_subscribed=Value(True)
+        ).prefetch_related(Prefetch('recipes', queryset=recipes))
+
+    def _recipe_ids(self, request, model):
+        """Return sorted ids of recipes in user Favorite or Cart.
+        ETag comes from the user version counter loaded with the user,
+        so revalidation doesn't touch the recipes tables."""
+        etag = quote_etag(f'{model._meta.model_name}-{request.user.pk}-'
+                          f'{user_state.get_version(model, request.user)}')
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response(
+                model.objects.filter(user=request.user)
+                .order_by('recipe_id').values_list('recipe_id', flat=True))
+        response['ETag'] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    @action(detail=False, url_path='me/favorites/ids',
+            permission_classes=[permissions.IsAuthenticated])
+    def favorites_ids(self, request):
+        return self._recipe_ids(request, Favorite)
+
+    @action(detail=False, url_path='me/cart/ids',
+            permission_classes=[permissions.IsAuthenticated])
+    def cart_ids(self, request):
+        return self._recipe_ids(request, Cart)
+
     @action(detail=False)
     def subscriptions(self, request):
-        following = User.objects.filter(following__user=request.user)
+        return versioned_response(
+            request, partial(self._subscriptions, request),
+            self.version_tables + (versions.RECIPES,),
+            *self.get_user_versions(request),
+            updated_at=last_recipe_update()
+        )
+
+    def _subscriptions(self, request):
+        following = self._with_recipes(
+            User.objects.filter(following__user=request.user))
         page = self.paginate_queryset(following)
         if page is not None:
             serializer = self.get_serializer(page, many=True)
@@ -168,22 +535,33 @@ class CustomUserViewSet(UserViewSet):
 
     @action(detail=True, methods=['post', 'delete'],
             http_method_names=['post', 'delete'])
+    @transaction.atomic
     def subscribe(self, request, *args, **kwargs):
-        author = get_object_or_404(User, pk=kwargs['id'])
-        follow_object = Follow.objects.filter(user=request.user, author=author)
         if request.method == 'POST':
+            author = get_object_or_404(self._with_recipes(User.objects.all()),
+                                       pk=kwargs['id'])
             if request.user == author:
                 raise serializers.ValidationError(
                     {'errors': 'Вы не можете подписываться на самого себя!'})
-            if follow_object.exists():
+            if not insert_ignore_conflicts(Follow, user=request.user,
+                                           author=author):
                 raise serializers.ValidationError(
                     {'errors': 'Вы уже подписаны на этого пользователя.'})
-            Follow.objects.create(user=request.user, author=author)
+            counters.followers_changed([author.pk], 1)
+            user_state.bump_version(Follow, [request.user.id])
+            author.refresh_from_db(fields=('followers_count',
+                                           'timeline_fanout'))
+            timeline.backfill(request.user.id, author)
             return Response(self.get_serializer(author).data,
                             status=status.HTTP_201_CREATED)
 
-        if not follow_object.exists():
+        deleted, _ = Follow.objects.filter(user=request.user,
+                                           author_id=kwargs['id']).delete()
+        if not deleted:
+            get_object_or_404(User, pk=kwargs['id'])
             raise serializers.ValidationError(
                 {'errors': 'Вы не подписаны на этого автора.'})
-        follow_object.delete()
+        counters.followers_changed([kwargs['id']], -1)
+        user_state.bump_version(Follow, [request.user.id])
+        timeline.trim(request.user.id, kwargs['id'])
         return Response(status=status.HTTP_204_NO_CONTENT)
@@ -0,0 +1,79 @@
+"""Benchmark of in-memory ingredient search over the full ingredient set.
+
+Usage (from backend/foodgram directory):
+    python -m benchmarks.ingredient_search [--budget-ms 1.0]
+
+Exits with non-zero code when 99th percentile of fuzzy search latency
+exceeds the budget.
+"""
+import argparse
+import csv
+import os
+import statistics
+import sys
+import time
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
+django.setup()
+
+from recipes.ingredient_index import IngredientIndex  # noqa: E402
+
+CSV_PATH = os.path.join(os.path.dirname(__file__), '..', '..', '..',
+                        'data', 'ingredients.csv')
+QUERIES = ['ёжевика', 'ежевика', 'сол', 'соль марская', 'памидор',
+           'картофель', 'картошка', 'малако', 'сыр пармизан', 'куринное филе',
+           'мука пшеничная', 'яйцо', 'сахор', 'перец чорный', 'масло сливчное']
+
+
+def load_rows(path):
+    with open(path, encoding='utf-8') as file:
+        return [{'id': number, 'name': name, 'measurement_unit': unit}
+                for number, (name, unit) in enumerate(csv.reader(file), 1)]
+
+
+def measure(search, queries, repeat):
+    timings = []
+    for _ in range(repeat):
+        for query in queries:
+            start = time.perf_counter()
+            search(query, 10)
+            timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return (statistics.median(timings),
+            timings[int(len(timings) * 0.99) - 1], timings[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--csv', default=CSV_PATH)
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--budget-ms', type=float, default=1.0)
+    args = parser.parse_args()
+
+    rows = load_rows(args.csv)
+    index = IngredientIndex()
+    start = time.perf_counter()
+    index.load(rows)
+    build_ms = (time.perf_counter() - start) * 1000
+    print(f'{len(rows)} ingredients, index built in {build_ms:.1f} ms')
+
+    results = {}
+    for name, search in (('prefix', index.prefix_search),
+                         ('fuzzy', index.fuzzy_search)):
+        results[name] = measure(search, QUERIES, args.repeat)
+        print('{:<7} p50={:.3f} ms  p99={:.3f} ms  max={:.3f} ms'.format(
+            name, *results[name]))
+
+    for query in QUERIES[:5]:
+        found = [row['name'] for row in index.search(query, 3)]
+        print(f'{query!r} -> {found}')
+
+    if results['fuzzy'][1] > args.budget_ms:
+        print(f'p99 exceeds budget of {args.budget_ms} ms')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
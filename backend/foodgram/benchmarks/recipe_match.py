@@ -0,0 +1,88 @@
+"""Benchmark of in-memory recipe matching by ingredients on synthetic data.
+
+Usage (from backend/foodgram directory):
+    python -m benchmarks.recipe_match [--recipes 100000] [--budget-ms 20]
+
+Recipes get 5-15 ingredients drawn from a skewed distribution, so common
+ingredients (like salt) have long posting lists. Every query ranks all
+candidates and builds the first page. Exits with non-zero code when 99th
+percentile of match latency exceeds the budget.
+"""
+import argparse
+import itertools
+import os
+import random
+import statistics
+import sys
+import time
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
+django.setup()
+
+from recipes.recipe_matcher import RecipeMatcher  # noqa: E402
+
+INGREDIENTS = 2188
+INGREDIENT_IDS = range(1, INGREDIENTS + 1)
+CUM_WEIGHTS = list(itertools.accumulate(1 / rank for rank in INGREDIENT_IDS))
+
+
+def random_ingredients(generator, low, high):
+    """Return set of ingredient ids with Zipf-like popularity."""
+    return set(generator.choices(INGREDIENT_IDS, cum_weights=CUM_WEIGHTS,
+                                 k=generator.randint(low, high)))
+
+
+def synthetic_rows(recipes, seed):
+    """Yield (recipe_id, ingredient_id) pairs of synthetic recipes."""
+    generator = random.Random(seed)
+    for recipe_id in range(1, recipes + 1):
+        for ingredient_id in random_ingredients(generator, 5, 15):
+            yield recipe_id, ingredient_id
+
+
+def pantry_queries(count, seed):
+    """Return match arguments with 3-20 ingredients a user may have."""
+    generator = random.Random(seed)
+    return [{'ingredients': random_ingredients(generator, 3, 20),
+             'include': random_ingredients(generator, 0, 1),
+             'exclude': {generator.choice(INGREDIENT_IDS)},
+             'min_coverage': generator.choice((0, 0.5, 1))}
+            for _ in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--recipes', type=int, default=100_000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--budget-ms', type=float, default=20.0)
+    args = parser.parse_args()
+
+    matcher = RecipeMatcher()
+    start = time.perf_counter()
+    matcher.load(synthetic_rows(args.recipes, args.seed))
+    build_ms = (time.perf_counter() - start) * 1000
+    print(f'{args.recipes} recipes, index built in {build_ms:.1f} ms')
+
+    timings, found = [], []
+    for query in pantry_queries(args.queries, args.seed):
+        start = time.perf_counter()
+        matches = matcher.match(**query)
+        matches[:6]  # The endpoint builds only the first page.
+        found.append(len(matches))
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    p99 = timings[int(len(timings) * 0.99) - 1]
+    print(f'match   p50={statistics.median(timings):.3f} ms  '
+          f'p99={p99:.3f} ms  max={timings[-1]:.3f} ms  '
+          f'median matches={statistics.median(found):.0f}')
+
+    if p99 > args.budget_ms:
+        print(f'p99 exceeds budget of {args.budget_ms} ms')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
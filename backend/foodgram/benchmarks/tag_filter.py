@@ -0,0 +1,92 @@
+"""Benchmark of tags filter by bitmask against EXISTS over TagRecipe.
+
+Usage (from backend/foodgram directory):
+    DB_ENGINE=django.db.backends.sqlite3 python -m benchmarks.tag_filter \
+        [--recipes 10000] [--tags 20]
+
+Creates test database, fills it with synthetic recipes having 1-4 tags
+(with both tags_mask and TagRecipe rows) and times count and first page
+of recipes with any of 1-3 random tags for both strategies.
+"""
+import argparse
+import os
+import random
+import statistics
+import time
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
+django.setup()
+
+from django.db import connection  # noqa: E402
+
+from recipes import tag_mask  # noqa: E402
+from recipes.models import Recipe, Tag, TagRecipe  # noqa: E402
+from users.models import User  # noqa: E402
+
+BATCH_SIZE = 5000
+STRATEGIES = {
+    'mask': tag_mask.filter_by_mask,
+    'exists': tag_mask.filter_by_join,
+}
+
+
+def fill(recipes, tags, seed):
+    generator = random.Random(seed)
+    author = User.objects.create(username='bench', email='bench@bench.ru')
+    Tag.objects.bulk_create(
+        [Tag(id=tag_id, name=f'Tag {tag_id}', color=f'#{tag_id:06x}',
+             slug=f't{tag_id}') for tag_id in range(1, tags + 1)],
+        ignore_conflicts=True
+    )
+    tag_ids = list(range(1, tags + 1))
+    recipe_tags = {recipe_id: generator.sample(tag_ids,
+                                               generator.randint(1, 4))
+                   for recipe_id in range(1, recipes + 1)}
+    Recipe.objects.bulk_create(
+        [Recipe(id=recipe_id, author=author, name=f'Recipe {recipe_id}',
+                text='', image='', cooking_time=10,
+                tags_mask=tag_mask.mask_of(recipe_tag_ids))
+         for recipe_id, recipe_tag_ids in recipe_tags.items()],
+        batch_size=BATCH_SIZE
+    )
+    TagRecipe.objects.bulk_create(
+        [TagRecipe(recipe_id=recipe_id, tag_id=tag_id)
+         for recipe_id, recipe_tag_ids in recipe_tags.items()
+         for tag_id in recipe_tag_ids],
+        batch_size=BATCH_SIZE
+    )
+    return tag_ids
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--recipes', type=int, default=10_000)
+    parser.add_argument('--tags', type=int, default=20)
+    parser.add_argument('--queries', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        tag_ids = fill(args.recipes, args.tags, args.seed)
+        generator = random.Random(args.seed)
+        queries = [generator.sample(tag_ids, generator.randint(1, 3))
+                   for _ in range(args.queries)]
+        for name, strategy in STRATEGIES.items():
+            timings = []
+            for query in queries:
+                start = time.perf_counter()
+                queryset = strategy(Recipe.objects.all(), query)
+                queryset.count()
+                list(queryset.order_by('-pub_date', '-pk')[:6])
+                timings.append((time.perf_counter() - start) * 1000)
+            print(f'{name:6}  p50={statistics.median(timings):.3f} ms  '
+                  f'max={max(timings):.3f} ms')
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
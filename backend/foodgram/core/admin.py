@@ -0,0 +1,15 @@
+from django.contrib import admin
+
+
+class ReadOnlyAdmin(admin.ModelAdmin):   # pragma: no cover
+    """Admin of rows maintained by API only: their writes update
+    aggregates (counters, per-user versions, shopping lists, timelines)
+    which admin would bypass."""
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
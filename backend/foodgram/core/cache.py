@@ -0,0 +1,97 @@
+"""Cache namespaces invalidated by generation.
+
+Keys of a namespace include its current generation, so bumping the
+generation makes all cached values of the namespace unreachable at once
+(they are evicted by timeout) without deleting keys one by one.
+Generations start from current time in milliseconds, so a generation
+evicted from cache is never reused with stale values.
+
+get_or_set_single_flight() refills expired values by one caller at a time
+(lock is taken with atomic cache.add()), so hot keys don't make all
+workers recompute them at once.
+
+Both need the cache shared by all workers (see CACHES in settings): with
+a local memory cache per process, generations are bumped only in the
+process handling the write and locks don't exclude other workers.
+"""
+import time
+from uuid import uuid4
+
+from django.core.cache import cache
+from django.db import transaction
+
+LOCK_TIMEOUT = 10
+WAIT_TIMEOUT = 5
+WAIT_INTERVAL = 0.05
+
+
+def _generation_key(namespace):
+    return f'{namespace}:generation'
+
+
+def _new_generation():
+    return time.time_ns() // 1_000_000
+
+
+def get_generation(namespace):
+    return cache.get_or_set(_generation_key(namespace), _new_generation,
+                            None)
+
+
+def bump_generation(namespace):
+    try:
+        cache.incr(_generation_key(namespace))
+    except ValueError:
+        cache.add(_generation_key(namespace), _new_generation(), None)
+
+
+def now_and_on_commit(invalidate):
+    """Call invalidate() now and, inside a transaction, after commit: the
+    second call drops values cached meanwhile from data read before
+    commit."""
+    invalidate()
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(invalidate)
+
+
+def namespaced_key(namespace, key):
+    """Return cache key of current generation of namespace."""
+    return f'{namespace}:{get_generation(namespace)}:{key}'
+
+
+def get_or_set_single_flight(key, default, timeout, stale_timeout=0):
+    """Return cached value of key, computing it with default() when it is
+    missing or older than timeout seconds. Only the caller holding the
+    key lock computes, others return the expired value (kept for extra
+    stale_timeout seconds) or wait for the fresh one. A caller that waited
+    longer than WAIT_TIMEOUT computes the value without caching."""
+    entry = cache.get(key)
+    if entry is not None and entry[0] > time.time():
+        return entry[1]
+    lock_key = f'{key}:lock'
+    token = uuid4().hex
+    deadline = time.monotonic() + WAIT_TIMEOUT
+    while not cache.add(lock_key, token, LOCK_TIMEOUT):
+        if entry is not None:
+            return entry[1]
+        if time.monotonic() >= deadline:
+            return default()
+        time.sleep(WAIT_INTERVAL)
+        entry = cache.get(key)
+    try:
+        entry = cache.get(key)
+        if entry is not None and entry[0] > time.time():
+            return entry[1]
+        value = default()
+        cache.set(key, (time.time() + timeout, value),
+                  timeout + stale_timeout)
+    finally:
+        _release(lock_key, token)
+    return value
+
+
+def _release(lock_key, token):
+    """Delete the lock unless it expired during the refill and was taken
+    by another caller."""
+    if cache.get(lock_key) == token:
+        cache.delete(lock_key)
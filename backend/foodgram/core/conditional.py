@@ -0,0 +1,37 @@
+"""Conditional GET for API views.
+
+Views compute validators with cheap queries (version counters and
+timestamps) and pass rendering as a callable, so 304 Not Modified is
+returned before the main query and serializer run.
+"""
+import hashlib
+
+from django.utils.cache import (get_conditional_response, patch_cache_control,
+                                patch_vary_headers)
+from django.utils.http import http_date, quote_etag
+
+
+def make_etag(*parts):
+    return quote_etag(
+        hashlib.md5('-'.join(map(str, parts)).encode()).hexdigest())
+
+
+def conditional_response(request, render, etag, last_modified=None):
+    """Return 304 response if request validators match etag and
+    last_modified (datetime or None), otherwise render() response.
+    Responses of authenticated users are private."""
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    response = get_conditional_response(request, etag=etag,
+                                        last_modified=timestamp)
+    if response is None:
+        response = render()
+    if response.status_code in (200, 304):
+        response['ETag'] = etag
+        if timestamp is not None:
+            response['Last-Modified'] = http_date(timestamp)
+    patch_vary_headers(response, ['Authorization'])
+    if request.user.is_authenticated:
+        patch_cache_control(response, private=True, no_cache=True)
+    else:
+        patch_cache_control(response, no_cache=True)
+    return response
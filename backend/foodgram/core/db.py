@@ -0,0 +1,33 @@
+from django.db import connection
+
+
+def bulk_insert_ignore_conflicts(model, objs, returning='pk'):
+    """Insert model objects with single INSERT ... ON CONFLICT DO NOTHING
+    statement. Objects conflicting with existing rows (unique constraints)
+    are skipped. Return values of returning field for inserted rows only."""
+    objs = list(objs)
+    if not objs:
+        return []
+    fields = [field for field in model._meta.concrete_fields
+              if field is not model._meta.auto_field]
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(field.column) for field in fields)
+    placeholders = ', '.join(
+        [f'({", ".join(["%s"] * len(fields))})'] * len(objs))
+    returning_column = model._meta.get_field(
+        model._meta.pk.name if returning == 'pk' else returning).column
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {quote(model._meta.db_table)} ({columns}) '
+            f'VALUES {placeholders} ON CONFLICT DO NOTHING '
+            f'RETURNING {quote(returning_column)}',
+            [field.get_db_prep_save(field.pre_save(obj, True), connection)
+             for obj in objs for field in fields]
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def insert_ignore_conflicts(model, **values):
+    """Insert model row unless it conflicts with existing one.
+    Return True if the row was inserted."""
+    return bool(bulk_insert_ignore_conflicts(model, [model(**values)]))
@@ -1,4 +1,5 @@
 import base64
+from urllib.parse import urlparse
 
 from django.core.files.base import ContentFile
 from django.utils.crypto import get_random_string
@@ -7,11 +8,22 @@ from rest_framework.serializers import ImageField
 
 class Base64ImageField(ImageField):
     """Custom image field that allows to
-    upload images as string encoded by base64."""
+    upload images as string encoded by base64.
+    URL of the current image is accepted as is, without decoding."""
     def to_internal_value(self, data):
+        current = self._get_current_image()
+        if (current and isinstance(data, str)
+                and urlparse(data).path == current.url):
+            return current
         if isinstance(data, str) and data.startswith('data:image'):
             format, imgstr = data.split(';base64,')
             ext = format.split('/')[-1]
             data = ContentFile(base64.b64decode(imgstr),
                                name=f'{get_random_string(length=20)}.{ext}')
         return super().to_internal_value(data)
+
+    def _get_current_image(self):
+        instance = getattr(self.parent, 'instance', None)
+        if instance is None or self.source == '*':
+            return None
+        return getattr(instance, self.source, None)
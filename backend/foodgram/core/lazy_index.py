@@ -0,0 +1,45 @@
+"""Per-process in-memory indexes of database rows.
+
+Indexes answer hot read queries without touching the database. An index
+is built on first use and rebuilt lazily after invalidate() call or when
+it is older than ttl seconds (to pick up changes made in other
+processes).
+"""
+import threading
+import time
+
+
+class LazyIndex:
+    """Base of in-memory indexes. Subclasses implement read() returning
+    rows from the database and build(rows) returning index data."""
+    ttl = 300
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = None
+
+    def invalidate(self):
+        with self._lock:
+            self._state = None
+
+    def read(self):
+        raise NotImplementedError
+
+    def build(self, rows):
+        raise NotImplementedError
+
+    def load(self, rows):
+        """Build index from rows."""
+        self._state = (time.monotonic(), self.build(rows))
+
+    def _is_fresh(self, state):
+        return state is not None and time.monotonic() - state[0] <= self.ttl
+
+    def _get_data(self):
+        state = self._state
+        if self._is_fresh(state):
+            return state[1]
+        with self._lock:
+            if not self._is_fresh(self._state):
+                self.load(self.read())
+            return self._state[1]
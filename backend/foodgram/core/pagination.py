@@ -1,6 +1,100 @@
-from rest_framework.pagination import PageNumberPagination
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (Cursor, CursorPagination,
+                                       PageNumberPagination)
 
 
 class CustomPagination(PageNumberPagination):
     """Custom pagination class with reassigned page_size_query_param."""
     page_size_query_param = 'limit'
+
+
+class RecipeCursorPagination(CursorPagination):
+    """Keyset pagination over the recipe feed ordering. Doesn't count rows,
+    so every page costs the same as the first one."""
+    page_size_query_param = 'limit'
+    ordering = ('-pub_date', '-pk')
+
+
+class MergedCursorPagination(RecipeCursorPagination):
+    """Keyset pagination over rows merged from several tables, which are
+    not one queryset. paginate_queryset takes a function returning up to
+    limit (pub_date, pk) positions after the position, newest first or
+    oldest first if reverse. Positions are unique, so cursors need no
+    offsets."""
+
+    def paginate_queryset(self, load_page, request, view=None):
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor is not None and self.cursor.reverse
+        position = (None if self.cursor is None
+                    else self.parse_position(self.cursor.position))
+        positions = list(load_page(position, reverse, self.page_size + 1))
+        has_following = len(positions) > self.page_size
+        positions = positions[:self.page_size]
+        if reverse:
+            positions.reverse()
+            self.has_next, self.has_previous = True, has_following
+        else:
+            self.has_next = has_following
+            self.has_previous = self.cursor is not None
+        self.page = positions
+        return positions
+
+    def parse_position(self, position):
+        pub_date, _, pk = (position or '').rpartition('_')
+        pub_date = parse_datetime(pub_date)
+        if pub_date is None or not pk.isdigit():
+            raise NotFound(self.invalid_cursor_message)
+        return pub_date, int(pk)
+
+    def _link(self, position, reverse):
+        pub_date, pk = position
+        return self.encode_cursor(
+            Cursor(offset=0, reverse=reverse,
+                   position=f'{pub_date.isoformat()}_{pk}'))
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self._link(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self._link(self.page[0], reverse=True)
+
+
+class RecipePagination(CustomPagination):
+    """Page number pagination with opt-in keyset mode. Keyset mode is used
+    when request has cursor param or pagination=cursor param. Ranked
+    results (ordering or search params) are always paginated by page
+    number."""
+    mode_query_param = 'pagination'
+    cursor_mode = 'cursor'
+    ranking_query_params = ('ordering', 'search')
+
+    def __init__(self):
+        self.cursor_paginator = None
+
+    def is_cursor_mode(self, request):
+        if any(request.query_params.get(param)
+               for param in self.ranking_query_params):
+            return False
+        return (RecipeCursorPagination.cursor_query_param
+                in request.query_params
+                or request.query_params.get(self.mode_query_param)
+                == self.cursor_mode)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.is_cursor_mode(request):
+            self.cursor_paginator = RecipeCursorPagination()
+            return self.cursor_paginator.paginate_queryset(queryset, request,
+                                                           view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -70,12 +70,30 @@ DATABASES = {
     }
 }
 
-if 'test' in sys.argv:
+if 'test' in sys.argv and not int(os.getenv('DJANGO_TEST_POSTGRES',
+                                            default=0)):
     DATABASES['default'] = {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
     }
 
+# Cache generations and refill locks must be shared by all workers, so
+# production sets CACHE_LOCATION (Redis by default). Local memory cache
+# used without it is only fit for a single process (tests, runserver).
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+if os.getenv('CACHE_LOCATION') and 'test' not in sys.argv:
+    CACHES['default'] = {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.redis.RedisCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION'),
+    }
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -1,6 +1,10 @@
 from django.contrib import admin
 
-from .models import (Cart, Favorite, Ingredient, IngredientRecipe, Recipe, Tag,
+from core.admin import ReadOnlyAdmin
+
+from . import shopping_list
+from .models import (Cart, Favorite, Ingredient, IngredientRecipe, Recipe,
+                     RecipeNeighbor, RecipeScore, ShoppingListItem, Tag,
                      TagRecipe)
 
 
@@ -16,15 +20,21 @@ class IngredientInlineAdmin(admin.TabularInline):
 
 
 class RecipeAdmin(admin.ModelAdmin):   # pragma: no cover
-    """Settings for recipe in admin panel."""
-    list_display = ('name', 'author')
+    """Settings for recipe in admin panel, keep shopping lists of users
+    with the recipe in cart in sync with inlines."""
+    list_display = ('name', 'author', 'favorites_count')
     list_filter = ('author', 'name', 'tags')
-    readonly_fields = ('favorite_count',)
+    readonly_fields = ('favorites_count', 'in_cart_count')
     inlines = [TagInlineAdmin, IngredientInlineAdmin]
 
-    @staticmethod
-    def favorite_count(obj):
-        return obj.followers.count()
+    def save_related(self, request, form, formsets, change):
+        recipe_id = form.instance.pk
+        amounts = shopping_list.recipe_amounts([recipe_id]) if change else {}
+        super().save_related(request, form, formsets, change)
+        changes = shopping_list.recipe_amounts([recipe_id])
+        for ingredient_id, amount in amounts.items():
+            changes[ingredient_id] = changes.get(ingredient_id, 0) - amount
+        shopping_list.change_recipe(recipe_id, changes)
 
 
 class IngredientAdmin(admin.ModelAdmin):
@@ -36,7 +46,10 @@ class IngredientAdmin(admin.ModelAdmin):
 admin.site.register(Tag)
 admin.site.register(Recipe, RecipeAdmin)
 admin.site.register(Ingredient, IngredientAdmin)
-admin.site.register(Favorite)
-admin.site.register(Cart)
-admin.site.register(IngredientRecipe)
+admin.site.register(Favorite, ReadOnlyAdmin)
+admin.site.register(Cart, ReadOnlyAdmin)
+admin.site.register(IngredientRecipe, ReadOnlyAdmin)
 admin.site.register(TagRecipe)
+admin.site.register(ShoppingListItem, ReadOnlyAdmin)
+admin.site.register(RecipeScore)
+admin.site.register(RecipeNeighbor)
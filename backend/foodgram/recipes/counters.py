@@ -0,0 +1,82 @@
+"""Denormalized counters of recipes and users.
+
+Counters are shifted with F() expressions in the transaction that changes
+the counted rows. reconcile() recomputes them from the source tables.
+"""
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from users.models import Follow
+
+from .models import Cart, Favorite, Recipe
+
+User = get_user_model()
+
+RECIPE_COUNTERS = {
+    Favorite: 'favorites_count',
+    Cart: 'in_cart_count',
+}
+
+COUNTED_ROWS = {
+    Recipe: {
+        'favorites_count': (Favorite, 'recipe'),
+        'in_cart_count': (Cart, 'recipe'),
+    },
+    User: {
+        'recipes_count': (Recipe, 'author'),
+        'followers_count': (Follow, 'author'),
+    },
+}
+
+
+def shift(queryset, field, delta):
+    """Add delta to counter field of queryset rows, never below zero."""
+    queryset.update(**{field: Greatest(F(field) + delta, 0)})
+
+
+def recipes_changed(model, recipe_ids, delta):
+    """Shift Favorite or Cart counter of recipes (queryset or ids)."""
+    shift(Recipe.objects.filter(pk__in=recipe_ids),
+          RECIPE_COUNTERS[model], delta)
+
+
+def followers_changed(author_ids, delta):
+    shift(User.objects.filter(pk__in=author_ids), 'followers_count', delta)
+
+
+def recipes_count_changed(author_ids, delta):
+    shift(User.objects.filter(pk__in=author_ids), 'recipes_count', delta)
+
+
+def _count(model, field):
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef('pk')})
+        .order_by().values(field).annotate(total=Count('pk'))
+        .values('total'),
+        output_field=IntegerField()
+    ), 0)
+
+
+def reconcile(check=False):
+    """Compare counters with the source tables and fix differing rows
+    (unless check). Return list of (model, pk, field, stored, actual)."""
+    mismatches = []
+    for model, counters in COUNTED_ROWS.items():
+        rows = model.objects.annotate(**{
+            f'actual_{field}': _count(*source)
+            for field, source in counters.items()
+        }).order_by('pk')
+        changed = []
+        for row in rows:
+            for field in counters:
+                actual = getattr(row, f'actual_{field}')
+                if getattr(row, field) != actual:
+                    mismatches.append((model, row.pk, field,
+                                       getattr(row, field), actual))
+                    setattr(row, field, actual)
+                    changed.append(row)
+        changed = list(dict.fromkeys(changed))
+        if changed and not check:
+            model.objects.bulk_update(changed, list(counters))
+    return mismatches
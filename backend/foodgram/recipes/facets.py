@@ -0,0 +1,70 @@
+"""Facet counts of filtered recipes for the filter sidebar.
+
+Counts per tag and per cooking time bucket come from one aggregate query
+with conditional COUNT for every facet value. Results are cached by
+filter signature in a cache namespace invalidated after commit of Recipe,
+TagRecipe and Tag writes.
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+
+from core.cache import bump_generation, namespaced_key
+
+from . import tag_mask
+from .tag_map import get_tag_map
+
+FACETS_NAMESPACE = 'recipes:facets'
+FACETS_TTL = getattr(settings, 'RECIPE_FACETS_TTL', 600)
+COOKING_TIME_BUCKETS = (
+    ('under_15', None, 15),
+    ('15_30', 15, 30),
+    ('30_60', 30, 60),
+    ('over_60', 60, None),
+)
+
+
+def _bucket_condition(low, high):
+    condition = Q()
+    if low is not None:
+        condition &= Q(cooking_time__gte=low)
+    if high is not None:
+        condition &= Q(cooking_time__lt=high)
+    return condition
+
+
+def count_facets(queryset):
+    """Return number of recipes of queryset and their counts per tag slug
+    and cooking time bucket (minutes, lower bound inclusive)."""
+    tag_map = get_tag_map()
+    aggregates = {'total': Count('pk')}
+    for tag_id in tag_map.values():
+        aggregates[f'tag_{tag_id}'] = Count('pk',
+                                            filter=tag_mask.has_tag(tag_id))
+    for name, low, high in COOKING_TIME_BUCKETS:
+        aggregates[f'time_{name}'] = Count(
+            'pk', filter=_bucket_condition(low, high))
+    counts = queryset.order_by().aggregate(**aggregates)
+    return {
+        'count': counts['total'],
+        'tags': {slug: counts[f'tag_{tag_id}']
+                 for slug, tag_id in tag_map.items()},
+        'cooking_time': {name: counts[f'time_{name}']
+                         for name, _, _ in COOKING_TIME_BUCKETS},
+    }
+
+
+def get_facets(queryset, signature):
+    """Return cached facet counts of queryset filtered by parameters
+    with JSON serializable signature."""
+    digest = hashlib.md5(
+        json.dumps(signature, sort_keys=True).encode()).hexdigest()
+    return cache.get_or_set(namespaced_key(FACETS_NAMESPACE, digest),
+                            lambda: count_facets(queryset), FACETS_TTL)
+
+
+def invalidate():
+    bump_generation(FACETS_NAMESPACE)
@@ -0,0 +1,51 @@
+"""Cache of viewer-independent recipe representations.
+
+Fragments are stored by recipe id and FRAGMENT_VERSION (bumped with
+representation format) in a cache namespace. Fragments of a recipe are
+deleted on writes of the recipe, its ingredients and tags rows and its
+author, both immediately and after commit: the second delete drops
+fragments cached by concurrent requests from data read before commit.
+Tags and ingredients are embedded into many recipes, so their writes
+drop the whole namespace.
+Deletes reach other workers only through the shared cache (see CACHES in
+settings). FRAGMENT_TTL bounds staleness left by writes sending no
+signals (queryset updates, raw SQL).
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+from core.cache import bump_generation, get_generation, now_and_on_commit
+
+FRAGMENTS_NAMESPACE = 'recipes:fragments'
+FRAGMENT_VERSION = 1
+FRAGMENT_TTL = getattr(settings, 'RECIPE_FRAGMENT_TTL', 300)
+AUTHOR_FIELDS = {'email', 'username', 'first_name', 'last_name'}
+
+
+def _keys(recipe_ids):
+    generation = get_generation(FRAGMENTS_NAMESPACE)
+    return {f'{FRAGMENTS_NAMESPACE}:{generation}:{FRAGMENT_VERSION}:'
+            f'{recipe_id}': recipe_id for recipe_id in recipe_ids}
+
+
+def get_many(recipe_ids):
+    """Return {recipe_id: fragment} of cached recipes."""
+    keys = _keys(recipe_ids)
+    return {keys[key]: fragment
+            for key, fragment in cache.get_many(keys).items()}
+
+
+def set_many(fragments):
+    """Cache fragments given as {recipe_id: fragment}."""
+    keys = _keys(fragments)
+    cache.set_many({key: fragments[recipe_id]
+                    for key, recipe_id in keys.items()}, FRAGMENT_TTL)
+
+
+def invalidate(recipe_ids):
+    recipe_ids = list(recipe_ids)
+    now_and_on_commit(lambda: cache.delete_many(list(_keys(recipe_ids))))
+
+
+def invalidate_all():
+    now_and_on_commit(lambda: bump_generation(FRAGMENTS_NAMESPACE))
@@ -0,0 +1,107 @@
+import bisect
+import hashlib
+import heapq
+from collections import Counter, defaultdict
+
+from django.conf import settings
+
+from core.lazy_index import LazyIndex
+
+from .models import Ingredient
+
+INDEX_TTL = getattr(settings, 'INGREDIENT_INDEX_TTL', 300)
+NGRAM_SIZE = 3
+SIMILARITY_THRESHOLD = 0.3
+
+
+def normalize(name):
+    """Normalize ingredient name for case insensitive lookups,
+    ё and е letters are treated as the same."""
+    return ' '.join(name.lower().replace('ё', 'е').split())
+
+
+def ngrams(name):
+    """Return set of character n-grams of normalized name. Words are padded
+    with spaces, so word beginnings have more weight."""
+    padded = f'  {name} '
+    return {padded[i:i + NGRAM_SIZE]
+            for i in range(len(padded) - NGRAM_SIZE + 1)}
+
+
+class IngredientIndex(LazyIndex):
+    """Per-process in-memory index of ingredient names.
+
+    Answers prefix queries with binary search over sorted names and fuzzy
+    queries with character n-gram inverted index, so autocomplete requests
+    don't reach the database. Rebuilt every INGREDIENT_INDEX_TTL seconds.
+    Version is a digest of the indexed rows, so it is the same in all
+    processes serving the same ingredients.
+    """
+    ttl = INDEX_TTL
+
+    def read(self):
+        return Ingredient.objects.values('id', 'name', 'measurement_unit')
+
+    def build(self, rows):
+        """Build index from dicts with id, name and measurement_unit keys."""
+        rows = sorted(rows, key=lambda row: (normalize(row['name']),
+                                             row['id']))
+        names = [normalize(row['name']) for row in rows]
+        grams = [ngrams(name) for name in names]
+        postings = defaultdict(list)
+        for position, name_grams in enumerate(grams):
+            for gram in name_grams:
+                postings[gram].append(position)
+        version = hashlib.md5(repr([
+            (row['id'], row['name'], row['measurement_unit']) for row in rows
+        ]).encode()).hexdigest()
+        return names, rows, grams, dict(postings), version
+
+    def version(self):
+        """Return version of indexed ingredients."""
+        return self._get_data()[-1]
+
+    def prefix_search(self, prefix='', limit=None):
+        """Return ingredients which names start with prefix. Exact matches
+        go first, the rest are sorted by name."""
+        names, rows, _, _, _ = self._get_data()
+        prefix = normalize(prefix)
+        start = bisect.bisect_left(names, prefix)
+        end = start
+        stop = len(names) if limit is None else min(start + limit,
+                                                    len(names))
+        while end < stop and names[end].startswith(prefix):
+            end += 1
+        return rows[start:end]
+
+    def fuzzy_search(self, query, limit=None):
+        """Return ingredients similar to query ranked by n-gram similarity
+        (shared n-grams divided by n-grams of both names)."""
+        names, rows, grams, postings, _ = self._get_data()
+        query_grams = ngrams(normalize(query))
+        shared = Counter()
+        for gram in query_grams:
+            shared.update(postings.get(gram, ()))
+        matches = []
+        for position, count in shared.items():
+            similarity = count / (len(query_grams) + len(grams[position])
+                                  - count)
+            if similarity >= SIMILARITY_THRESHOLD:
+                matches.append((-similarity, names[position], position))
+        if limit is None:
+            matches.sort()
+        else:
+            matches = heapq.nsmallest(limit, matches)
+        return [rows[position] for _, _, position in matches]
+
+    def search(self, query='', limit=None, fuzzy=False):
+        """Prefix search which falls back to fuzzy search when nothing
+        was found. With fuzzy=True only fuzzy search is used."""
+        if not fuzzy:
+            results = self.prefix_search(query, limit)
+            if results or not query.strip():
+                return results
+        return self.fuzzy_search(query, limit)
+
+
+ingredient_index = IngredientIndex()
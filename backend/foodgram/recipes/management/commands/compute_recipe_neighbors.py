@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from recipes import recommendations
+
+
+class Command(BaseCommand):
+    help = ('Recompute similar recipes from favorites and shopping carts '
+            'co-occurrence.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-k', type=int,
+                            default=recommendations.TOP_K,
+                            help='Number of neighbours stored per recipe.')
+        parser.add_argument('--block-size', type=int,
+                            default=recommendations.BLOCK_SIZE,
+                            help='Maximum number of recipes multiplied '
+                                 'at once.')
+        parser.add_argument('--max-products', type=int,
+                            default=recommendations.MAX_BLOCK_PRODUCTS,
+                            help='Maximum number of similarities computed '
+                                 'at once, bounds memory usage.')
+
+    def handle(self, *args, **options):
+        stored = recommendations.rebuild(
+            top_k=options['top_k'], block_size=options['block_size'],
+            max_products=options['max_products'])
+        self.stdout.write(self.style.SUCCESS(
+            f'{stored} similar recipes were stored.'))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from recipes import scores
+
+
+class Command(BaseCommand):
+    help = ('Recompute popularity scores of recipes from favorites '
+            'and shopping carts activity.')
+
+    def handle(self, *args, **options):
+        scored = scores.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Scores were computed, {scored} recipes have activity.'))
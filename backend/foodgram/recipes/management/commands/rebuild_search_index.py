@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from recipes import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild full-text search data of all recipes.'
+
+    def handle(self, *args, **options):
+        search.reindex()
+        self.stdout.write(self.style.SUCCESS('Search index was rebuilt.'))
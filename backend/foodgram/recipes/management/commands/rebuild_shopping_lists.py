@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes import shopping_list
+
+
+class Command(BaseCommand):
+    help = ('Rebuild shopping lists aggregate table from users carts '
+            'and verify it against the live aggregation.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='Only verify the table, without rebuild.')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            if not options['check']:
+                shopping_list.rebuild()
+                self.stdout.write('Shopping lists were rebuilt.')
+            live = shopping_list.live_items()
+            stored = shopping_list.stored_items()
+        mismatches = {key for key in live.keys() | stored.keys()
+                      if live.get(key) != stored.get(key)}
+        for user_id, ingredient_id in sorted(mismatches):
+            self.stderr.write(
+                f'User {user_id}, ingredient {ingredient_id}: '
+                f'stored {stored.get((user_id, ingredient_id))}, '
+                f'expected {live.get((user_id, ingredient_id))}')
+        if mismatches:
+            raise CommandError(f'{len(mismatches)} shopping list items '
+                               f'differ from the live aggregation.')
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(stored)} shopping list items match the live aggregation.'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from recipes import timeline
+
+
+class Command(BaseCommand):
+    help = 'Refill subscription timelines of all users from subscriptions.'
+
+    def handle(self, *args, **options):
+        timeline.rebuild()
+        self.stdout.write(self.style.SUCCESS('Timelines were rebuilt.'))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes import counters
+
+
+class Command(BaseCommand):
+    help = ('Recompute denormalized counters of recipes and users '
+            'from the source tables and fix drifted values.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='Only report drifted counters, without fix.')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            mismatches = counters.reconcile(check=options['check'])
+        for model, pk, field, stored, actual in mismatches:
+            self.stderr.write(f'{model.__name__} {pk}, {field}: '
+                              f'stored {stored}, expected {actual}')
+        if mismatches and options['check']:
+            raise CommandError(f'{len(mismatches)} counters differ '
+                               f'from the source tables.')
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(mismatches)} counters were fixed.' if mismatches
+            else 'All counters match the source tables.'))
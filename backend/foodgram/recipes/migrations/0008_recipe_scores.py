@@ -0,0 +1,79 @@
+# Generated by Django 4.1.7 on 2026-10-17 06:09
+
+from datetime import timedelta
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+BATCH_SIZE = 1000
+WEIGHTS = {'favorites_count': 1.0, 'in_cart_count': 2.0}
+
+
+def fill_scores(apps, schema_editor):
+    """Existing rows have no creation time. They are dated right outside
+    of trending window, so they count to popularity (decaying from then
+    on) but not to trending, and scores are computed accordingly."""
+    Cart = apps.get_model('recipes', 'Cart')
+    Favorite = apps.get_model('recipes', 'Favorite')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    RecipeScore = apps.get_model('recipes', 'RecipeScore')
+    window = getattr(settings, 'RECIPE_TRENDING_WINDOW', 7)
+    half_life = getattr(settings, 'RECIPE_POPULAR_HALF_LIFE', 30)
+    now = timezone.now()
+    for model in (Favorite, Cart):
+        model.objects.update(created=now - timedelta(days=window))
+    decay = 0.5 ** (window / half_life)
+    RecipeScore.objects.bulk_create(
+        (RecipeScore(recipe_id=row['pk'], computed_at=now,
+                     popular=decay * sum(row[field] * weight
+                                         for field, weight in WEIGHTS.items()))
+         for row in Recipe.objects.values('pk', *WEIGHTS).iterator()),
+        batch_size=BATCH_SIZE
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_recipe_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeScore',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='score', serialize=False, to='recipes.recipe', verbose_name='Рецепт')),
+                ('popular', models.FloatField(default=0, verbose_name='Популярность')),
+                ('trending', models.FloatField(default=0, verbose_name='Набирает популярность')),
+                ('computed_at', models.DateTimeField(null=True, verbose_name='Дата расчёта')),
+            ],
+            options={
+                'verbose_name': 'Рейтинг рецепта',
+                'verbose_name_plural': 'Рейтинги рецептов',
+            },
+        ),
+        migrations.AddField(
+            model_name='cart',
+            name='created',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now, verbose_name='Дата добавления'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='favorite',
+            name='created',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now, verbose_name='Дата добавления'),
+            preserve_default=False,
+        ),
+        migrations.AddIndex(
+            model_name='recipescore',
+            index=models.Index(fields=['-popular', '-recipe'], name='recipe_score_popular_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipescore',
+            index=models.Index(fields=['-trending', '-recipe'], name='recipe_score_trending_idx'),
+        ),
+        migrations.RunPython(fill_scores, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.1.7 on 2026-10-17 06:20
+
+from django.db import migrations, models
+
+MASK_WIDTH = 63
+
+
+def fill_tags_mask(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    TagRecipe = apps.get_model('recipes', 'TagRecipe')
+    masks = {}
+    for recipe_id, tag_id in TagRecipe.objects.values_list('recipe_id',
+                                                           'tag_id'):
+        if tag_id <= MASK_WIDTH:
+            masks[recipe_id] = masks.get(recipe_id, 0) | 1 << (tag_id - 1)
+    Recipe.objects.bulk_update(
+        [Recipe(pk=recipe_id, tags_mask=mask)
+         for recipe_id, mask in masks.items()],
+        ['tags_mask'], batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_recipe_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='tags_mask',
+            field=models.BigIntegerField(default=0, editable=False, verbose_name='Битовая маска тегов'),
+        ),
+        migrations.RunPython(fill_tags_mask, migrations.RunPython.noop),
+    ]
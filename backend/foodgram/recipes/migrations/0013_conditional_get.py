@@ -0,0 +1,42 @@
+# Generated by Django 4.1.7 on 2026-10-17 06:42
+
+from django.db import migrations, models
+from django.db.models import F
+
+TABLES = ('ingredients', 'recipes', 'scores', 'tags', 'users')
+
+
+def fill_versions(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    TableVersion = apps.get_model('recipes', 'TableVersion')
+    Recipe.objects.update(updated_at=F('pub_date'))
+    TableVersion.objects.bulk_create(
+        [TableVersion(table=table) for table in TABLES])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0012_timelineentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TableVersion',
+            fields=[
+                ('table', models.CharField(max_length=50, primary_key=True, serialize=False, verbose_name='Таблица')),
+                ('version', models.PositiveBigIntegerField(default=0, verbose_name='Версия')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата изменения')),
+            ],
+            options={
+                'verbose_name': 'Версия таблицы',
+                'verbose_name_plural': 'Версии таблиц',
+            },
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, verbose_name='Дата изменения рецепта'),
+        ),
+        migrations.RunPython(fill_versions, migrations.RunPython.noop),
+    ]
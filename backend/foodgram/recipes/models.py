@@ -1,6 +1,11 @@
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator
 from django.db import models
+from django.db.models import (Exists, OuterRef, Prefetch, Value,
+                              prefetch_related_objects)
+
+from users.models import Follow
 
 from .constants import MIN_AMOUNT_OF_INGREDIENTS, MIN_COOKING_TIME
 from .validators import validate_hex
@@ -36,6 +41,39 @@ class Tag(models.Model):
         return self.name
 
 
+def load_related(recipes):
+    """Load author, tags and ingredients of fetched recipes
+    in a fixed number of queries."""
+    prefetch_related_objects(recipes, 'author', 'tags', Prefetch(
+        'recipe_ingredients',
+        queryset=IngredientRecipe.objects.select_related('ingredient')
+    ))
+
+
+class RecipeQuerySet(models.QuerySet):
+    """QuerySet with builders for the recipe read paths."""
+
+    def with_user_flags(self, user, recipe_flags=True):
+        """Annotate is_favorited, is_in_shopping_cart and
+        author_is_subscribed flags for the given user. With
+        recipe_flags=False only the author flag is annotated."""
+        if not user.is_authenticated:
+            return self.annotate(author_is_subscribed=Value(False))
+        queryset = self.annotate(author_is_subscribed=Exists(
+            Follow.objects.filter(user=user, author=OuterRef('author'))
+        ))
+        if not recipe_flags:
+            return queryset
+        return queryset.annotate(
+            is_favorited=Exists(
+                Favorite.objects.filter(user=user, recipe=OuterRef('pk'))
+            ),
+            is_in_shopping_cart=Exists(
+                Cart.objects.filter(user=user, recipe=OuterRef('pk'))
+            )
+        )
+
+
 class Recipe(models.Model):
     author = models.ForeignKey(User,
                                on_delete=models.CASCADE,
@@ -58,9 +96,25 @@ class Recipe(models.Model):
         validators=[MinValueValidator(MIN_COOKING_TIME)]
     )
     pub_date = models.DateTimeField('Дата создания рецепта', auto_now_add=True)
+    updated_at = models.DateTimeField('Дата изменения рецепта', auto_now=True,
+                                      db_index=True)
+    favorites_count = models.PositiveIntegerField('В избранном', default=0,
+                                                  editable=False)
+    in_cart_count = models.PositiveIntegerField('В корзинах', default=0,
+                                                editable=False)
+    search_vector = SearchVectorField('Поисковый вектор', null=True,
+                                      editable=False)
+    tags_mask = models.BigIntegerField('Битовая маска тегов', default=0,
+                                       editable=False)
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         ordering = ('-pub_date', '-pk')
+        indexes = [
+            models.Index(fields=['-pub_date', '-id'],
+                         name='recipe_pub_date_idx'),
+        ]
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
 
@@ -117,6 +171,7 @@ class Favorite(models.Model):
                                on_delete=models.CASCADE,
                                related_name='followers',
                                verbose_name='Рецепт')
+    created = models.DateTimeField('Дата добавления', auto_now_add=True)
 
     class Meta:
         verbose_name = 'Избранное'
@@ -141,6 +196,7 @@ class Cart(models.Model):
                                on_delete=models.CASCADE,
                                related_name='in_cart',
                                verbose_name='Рецепт')
+    created = models.DateTimeField('Дата добавления', auto_now_add=True)
 
     class Meta:
         verbose_name = 'Корзина'
@@ -154,3 +210,144 @@ class Cart(models.Model):
 
     def __str__(self):
         return f'У пользователя {self.user} в корзине рецепт {self.recipe}'
+
+
+class ShoppingListItem(models.Model):
+    """Total amount of ingredient in user shopping cart. Maintained by
+    recipes.shopping_list functions on Cart and recipe ingredients writes."""
+    user = models.ForeignKey(User,
+                             on_delete=models.CASCADE,
+                             related_name='shopping_list',
+                             verbose_name='Пользователь')
+    ingredient = models.ForeignKey(Ingredient,
+                                   on_delete=models.CASCADE,
+                                   related_name='shopping_list_items',
+                                   verbose_name='Ингредиент')
+    amount = models.PositiveIntegerField('Количество')
+
+    class Meta:
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Списки покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping_list_item'
+            )
+        ]
+
+    def __str__(self):
+        return (f'У пользователя {self.user} в списке покупок '
+                f'{self.ingredient}: {self.amount}')
+
+
+class RecipeScore(models.Model):
+    """Popularity of recipe computed from Favorite and Cart activity with
+    time decay. Recomputed by compute_recipe_scores command."""
+    recipe = models.OneToOneField(Recipe,
+                                  on_delete=models.CASCADE,
+                                  primary_key=True,
+                                  related_name='score',
+                                  verbose_name='Рецепт')
+    popular = models.FloatField('Популярность', default=0)
+    trending = models.FloatField('Набирает популярность', default=0)
+    computed_at = models.DateTimeField('Дата расчёта', null=True)
+
+    class Meta:
+        verbose_name = 'Рейтинг рецепта'
+        verbose_name_plural = 'Рейтинги рецептов'
+        indexes = [
+            models.Index(fields=['-popular', '-recipe'],
+                         name='recipe_score_popular_idx'),
+            models.Index(fields=['-trending', '-recipe'],
+                         name='recipe_score_trending_idx'),
+        ]
+
+    def __str__(self):
+        return (f'Рейтинг рецепта {self.recipe_id}: {self.popular:.2f}, '
+                f'{self.trending:.2f}')
+
+
+class RecipeNeighbor(models.Model):
+    """Recipe similar to another one by users who favorited or added both
+    to shopping cart. Recomputed by compute_recipe_neighbors command."""
+    recipe = models.ForeignKey(Recipe,
+                               on_delete=models.CASCADE,
+                               related_name='neighbors',
+                               verbose_name='Рецепт')
+    neighbor = models.ForeignKey(Recipe,
+                                 on_delete=models.CASCADE,
+                                 related_name='neighbor_of',
+                                 verbose_name='Похожий рецепт')
+    score = models.FloatField('Сходство')
+
+    class Meta:
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipe', 'neighbor'],
+                name='unique_recipe_neighbor'
+            )
+        ]
+        indexes = [
+            models.Index(fields=['recipe', '-score'],
+                         name='recipe_neighbor_score_idx'),
+        ]
+
+    def __str__(self):
+        return (f'Рецепт {self.neighbor_id} похож на {self.recipe_id}: '
+                f'{self.score:.2f}')
+
+
+class TimelineEntry(models.Model):
+    """Recipe in the subscription feed of a follower of its author.
+    Written on recipe create (fan-out-on-write) and subscribe, removed
+    on unsubscribe and with the recipe. pub_date is copied from the
+    recipe to page the feed by the timeline index."""
+    user = models.ForeignKey(User,
+                             on_delete=models.CASCADE,
+                             related_name='timeline',
+                             verbose_name='Подписчик')
+    recipe = models.ForeignKey(Recipe,
+                               on_delete=models.CASCADE,
+                               related_name='timeline_entries',
+                               verbose_name='Рецепт')
+    author = models.ForeignKey(User,
+                               on_delete=models.CASCADE,
+                               related_name='+',
+                               verbose_name='Автор')
+    pub_date = models.DateTimeField('Дата создания рецепта')
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_timeline_entry'
+            )
+        ]
+        indexes = [
+            models.Index(fields=['user', 'author'],
+                         name='timeline_user_author_idx'),
+            models.Index(fields=['user', '-pub_date', '-recipe'],
+                         name='timeline_user_pub_date_idx'),
+        ]
+
+    def __str__(self):
+        return f'Рецепт {self.recipe_id} в ленте {self.user_id}'
+
+
+class TableVersion(models.Model):
+    """Version counter of a table, incremented in transactions writing
+    the table. Serves as validator for conditional GET."""
+    table = models.CharField('Таблица', max_length=50, primary_key=True)
+    version = models.PositiveBigIntegerField('Версия', default=0)
+    updated_at = models.DateTimeField('Дата изменения', auto_now=True)
+
+    class Meta:
+        verbose_name = 'Версия таблицы'
+        verbose_name_plural = 'Версии таблиц'
+
+    def __str__(self):
+        return f'{self.table}: {self.version}'
@@ -0,0 +1,30 @@
+"""Cache of recipe list and detail responses of anonymous users.
+
+Anonymous users see the same pages, so responses are cached by URL with
+normalized query params in a cache namespace. Its generation is bumped
+on writes of recipes and data rendered with them (immediately and after
+commit) and on recompute of recipe scores. Expired pages are refilled
+by one worker at a time, the others serve the stale page meanwhile.
+"""
+import hashlib
+
+from django.conf import settings
+
+from core.cache import (bump_generation, get_or_set_single_flight,
+                        namespaced_key, now_and_on_commit)
+
+PAGES_NAMESPACE = 'recipes:anonymous-pages'
+PAGE_TTL = getattr(settings, 'RECIPE_PAGE_TTL', 60)
+PAGE_STALE_TTL = getattr(settings, 'RECIPE_PAGE_STALE_TTL', 30)
+
+
+def get_or_render(signature, render):
+    """Return cached page with the signature string or render() it."""
+    digest = hashlib.md5(signature.encode()).hexdigest()
+    return get_or_set_single_flight(
+        namespaced_key(PAGES_NAMESPACE, digest), render, PAGE_TTL,
+        PAGE_STALE_TTL)
+
+
+def invalidate():
+    now_and_on_commit(lambda: bump_generation(PAGES_NAMESPACE))
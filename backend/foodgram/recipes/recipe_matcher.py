@@ -0,0 +1,96 @@
+from collections import defaultdict
+from collections.abc import Sequence
+from functools import reduce
+
+import numpy as np
+from django.conf import settings
+
+from core.lazy_index import LazyIndex
+
+from .models import IngredientRecipe
+
+MATCHER_TTL = getattr(settings, 'RECIPE_MATCHER_TTL', 300)
+
+
+class RecipeMatches(Sequence):
+    """Ranked matches stored as arrays. Items are (recipe_id, matched,
+    total) tuples built only for the requested slice (page)."""
+    def __init__(self, recipe_ids, matched, totals):
+        self._columns = (recipe_ids, matched, totals)
+
+    def __len__(self):
+        return len(self._columns[0])
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(zip(*(column[index].tolist()
+                              for column in self._columns)))
+        return tuple(column[index].item() for column in self._columns)
+
+
+class RecipeMatcher(LazyIndex):
+    """Per-process inverted index of recipe ingredients.
+
+    Maps every ingredient to sorted array of ids of recipes using it and
+    keeps number of ingredients of every recipe (indexed by recipe id), so
+    "cook with what I have" queries are answered by counting over posting
+    arrays of the requested ingredients without touching the database.
+    Rebuilt every RECIPE_MATCHER_TTL seconds.
+    """
+    ttl = MATCHER_TTL
+
+    def read(self):
+        return IngredientRecipe.objects.order_by().values_list(
+            'recipe_id', 'ingredient_id').iterator()
+
+    def build(self, rows):
+        """Build index from (recipe_id, ingredient_id) pairs."""
+        postings = defaultdict(list)
+        for recipe_id, ingredient_id in rows:
+            postings[ingredient_id].append(recipe_id)
+        postings = {ingredient_id: np.unique(np.array(recipe_ids,
+                                                      dtype=np.int64))
+                    for ingredient_id, recipe_ids in postings.items()}
+        sizes = np.bincount(
+            np.concatenate(list(postings.values()) or [np.empty(0, np.int64)])
+        )
+        return postings, sizes
+
+    @staticmethod
+    def _recipes_of(postings, ingredient_ids):
+        return [postings[ingredient_id] for ingredient_id in ingredient_ids
+                if ingredient_id in postings]
+
+    def match(self, ingredients, include=(), exclude=(), min_coverage=0):
+        """Return RecipeMatches for recipes which use any of ingredients,
+        all of include and none of exclude ingredients, and have at least
+        min_coverage share of own ingredients in ingredients. Best covered
+        recipes go first, then recipes with more matched ingredients
+        and newer ones."""
+        postings, sizes = self._get_data()
+        counts = np.zeros(len(sizes), dtype=np.int64)
+        for recipe_ids in self._recipes_of(postings, set(ingredients)):
+            counts[recipe_ids] += 1
+        selected = (counts > 0) & (counts >= min_coverage * sizes)
+
+        if include:
+            required = self._recipes_of(postings, set(include))
+            allowed = np.zeros(len(sizes), dtype=bool)
+            if len(required) == len(set(include)):
+                allowed[reduce(
+                    lambda left, right: np.intersect1d(
+                        left, right, assume_unique=True),
+                    sorted(required, key=len))] = True
+            selected &= allowed
+        for recipe_ids in self._recipes_of(postings, set(exclude)):
+            selected[recipe_ids] = False
+
+        recipe_ids = np.flatnonzero(selected)
+        matched = counts[recipe_ids]
+        totals = sizes[recipe_ids]
+        order = np.lexsort((-recipe_ids, -matched, -matched / totals))
+        return RecipeMatches(recipe_ids[order], matched[order],
+                             totals[order])
+
+
+recipe_matcher = RecipeMatcher()
@@ -0,0 +1,81 @@
+"""Side effects of writes of recipe ingredients and tags rows.
+
+Rows written one by one outside of the recipe save (admin inlines, m2m
+managers, cascades, scripts) are collected per transaction. After commit
+tags masks of recipes with changed tags are refreshed, the recipes are
+touched with one UPDATE of updated_at and caches rendering them are
+invalidated once, however many rows were written.
+The pending recipes live in on-commit callbacks, so they are discarded
+on rollback.
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from . import facets, fragments, page_cache, tag_mask, versions
+from .models import Recipe
+from .recipe_matcher import recipe_matcher
+
+
+class PendingRecipes:
+    """On-commit callback applying changes of collected recipes."""
+    def __init__(self):
+        self.recipe_ids = set()
+        self.tagged_ids = set()
+        self.done = False
+
+    def __call__(self):
+        self.done = True
+        apply(self.recipe_ids, self.tagged_ids)
+
+
+def apply(recipe_ids, tagged_ids=()):
+    if not recipe_ids:
+        return
+    if tagged_ids:
+        tag_mask.refresh(tagged_ids)
+    Recipe.objects.filter(pk__in=recipe_ids).update(
+        updated_at=timezone.now())
+    versions.bump(versions.RECIPES)
+    fragments.invalidate(recipe_ids)
+    page_cache.invalidate()
+    facets.invalidate()
+    recipe_matcher.invalidate()
+
+
+def _pending(connection, create=True):
+    """Return callback of the current savepoint, so changes made in rolled
+    back savepoints are discarded with it."""
+    savepoint_ids = set(connection.savepoint_ids)
+    for sids, callback, *_ in connection.run_on_commit:
+        if (isinstance(callback, PendingRecipes) and not callback.done
+                and sids == savepoint_ids):
+            return callback
+    if not create:
+        return None
+    pending = PendingRecipes()
+    transaction.on_commit(pending)
+    return pending
+
+
+def changed(recipe_ids, tags=False):
+    """Rows of recipes were written, tags rows if tags is True."""
+    recipe_ids = set(recipe_ids)
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        apply(recipe_ids, recipe_ids if tags else ())
+        return
+    pending = _pending(connection)
+    pending.recipe_ids |= recipe_ids
+    if tags:
+        pending.tagged_ids |= recipe_ids
+
+
+def deleted(recipe_ids):
+    """Recipes were deleted with their rows, they have nothing to touch.
+    Caches are invalidated by the recipe delete."""
+    connection = transaction.get_connection()
+    pending = connection.in_atomic_block and _pending(connection,
+                                                      create=False)
+    if pending:
+        pending.recipe_ids.difference_update(recipe_ids)
+        pending.tagged_ids.difference_update(recipe_ids)
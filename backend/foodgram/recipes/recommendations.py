@@ -0,0 +1,124 @@
+"""Item-to-item recipe recommendations.
+
+Favorite and Cart rows form a sparse recipe-by-user matrix. Its rows are
+normalized, so product of a block of rows with the transposed matrix gives
+cosine similarity of the block recipes with all recipes. Blocks are
+processed one by one and only top-K neighbours of every recipe are kept.
+Blocks are sized by an upper bound of their products (co-occurring
+pairs, a recipe of popular users pairs with almost every recipe), so
+memory is bounded by the matrix itself plus MAX_BLOCK_PRODUCTS entries.
+Interactions are read into compact arrays which are released once the
+matrix is built. Results are stored in RecipeNeighbor table read by
+the API.
+"""
+from array import array
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from scipy import sparse
+
+from .models import RecipeNeighbor
+from .scores import ACTIVITY_WEIGHTS
+
+TOP_K = getattr(settings, 'RECIPE_NEIGHBORS_TOP_K', 20)
+BLOCK_SIZE = getattr(settings, 'RECIPE_NEIGHBORS_BLOCK_SIZE', 1000)
+MAX_BLOCK_PRODUCTS = getattr(settings, 'RECIPE_NEIGHBORS_MAX_BLOCK_PRODUCTS',
+                             10_000_000)
+CHUNK_SIZE = 10000
+
+
+def load_interactions(chunk_size=CHUNK_SIZE):
+    """Read Favorite and Cart rows in chunks into compact arrays
+    of recipe ids, user ids and weights of every model rows."""
+    recipe_ids, user_ids, counts = array('q'), array('q'), []
+    for model in ACTIVITY_WEIGHTS:
+        rows = model.objects.order_by().values_list('recipe_id', 'user_id')
+        count = len(recipe_ids)
+        for recipe_id, user_id in rows.iterator(chunk_size=chunk_size):
+            recipe_ids.append(recipe_id)
+            user_ids.append(user_id)
+        counts.append(len(recipe_ids) - count)
+    return (np.frombuffer(recipe_ids, dtype=np.int64),
+            np.frombuffer(user_ids, dtype=np.int64),
+            np.repeat(np.array(list(ACTIVITY_WEIGHTS.values()),
+                               dtype=np.float32), counts))
+
+
+def build_matrix(recipe_ids, user_ids, weights):
+    """Return ids of recipes (matrix rows) and recipe-by-user CSR matrix
+    with rows of unit length. Weights of repeated pairs are summed."""
+    recipes, rows = np.unique(recipe_ids, return_inverse=True)
+    users, columns = np.unique(user_ids, return_inverse=True)
+    matrix = sparse.csr_matrix((weights, (rows, columns)),
+                               shape=(len(recipes), len(users)))
+    norms = np.sqrt(matrix.multiply(matrix).sum(axis=1)).A1
+    return recipes, sparse.diags(1 / norms) @ matrix
+
+
+def block_bounds(matrix, transposed, block_size=BLOCK_SIZE,
+                 max_products=MAX_BLOCK_PRODUCTS):
+    """Yield (start, stop) of row blocks of at most block_size rows with
+    at most max_products entries in product with transposed matrix.
+    Entries of a row are bounded by the sum of its users interactions and
+    by the number of recipes. A single row may exceed max_products."""
+    user_interactions = np.diff(transposed.indptr)
+    products = np.minimum(
+        np.add.reduceat(user_interactions[matrix.indices],
+                        matrix.indptr[:-1]),
+        matrix.shape[0]
+    ).cumsum()
+    start = 0
+    while start < matrix.shape[0]:
+        budget = max_products + (products[start - 1] if start else 0)
+        stop = int(np.searchsorted(products, budget, side='right'))
+        stop = min(max(stop, start + 1), start + block_size)
+        yield start, stop
+        start = stop
+
+
+def top_neighbors(recipes, matrix, top_k=TOP_K, block_size=BLOCK_SIZE,
+                  max_products=MAX_BLOCK_PRODUCTS):
+    """Yield (recipe_id, neighbor_id, score) of top_k most similar
+    recipes for every matrix row."""
+    transposed = matrix.T.tocsr()
+    for start, stop in block_bounds(matrix, transposed, block_size,
+                                    max_products):
+        block = (matrix[start:stop] @ transposed).tocsr()
+        for row in range(block.shape[0]):
+            bounds = slice(block.indptr[row], block.indptr[row + 1])
+            columns, scores = block.indices[bounds], block.data[bounds]
+            other = columns != start + row
+            columns, scores = columns[other], scores[other]
+            if len(scores) > top_k:
+                top = np.argpartition(-scores, top_k)[:top_k]
+                columns, scores = columns[top], scores[top]
+            recipe_id = int(recipes[start + row])
+            yield from ((recipe_id, neighbor_id, score) for neighbor_id, score
+                        in zip(recipes[columns].tolist(), scores.tolist()))
+
+
+def rebuild(top_k=TOP_K, block_size=BLOCK_SIZE, chunk_size=CHUNK_SIZE,
+            max_products=MAX_BLOCK_PRODUCTS):
+    """Replace RecipeNeighbor rows with freshly computed neighbours.
+    Return number of stored rows."""
+    interactions = load_interactions(chunk_size)
+    stored = 0
+    with transaction.atomic():
+        RecipeNeighbor.objects.all().delete()
+        if not len(interactions[0]):
+            return stored
+        recipes, matrix = build_matrix(*interactions)
+        del interactions
+        batch = []
+        for recipe_id, neighbor_id, score in top_neighbors(
+                recipes, matrix, top_k=top_k, block_size=block_size,
+                max_products=max_products):
+            batch.append(RecipeNeighbor(recipe_id=recipe_id,
+                                        neighbor_id=neighbor_id, score=score))
+            if len(batch) >= chunk_size:
+                RecipeNeighbor.objects.bulk_create(batch)
+                stored += len(batch)
+                batch = []
+        RecipeNeighbor.objects.bulk_create(batch)
+    return stored + len(batch)
@@ -0,0 +1,67 @@
+"""Popularity scores of recipes.
+
+Every Favorite or Cart row adds its weight to the recipe score, halved
+for every half-life passed since the row was created. Activity is read
+once, grouped by recipe and day, and scores of all recipes are written
+in batches to RecipeScore table which backs the ranked feed orderings.
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from . import page_cache, versions
+from .models import Cart, Favorite, Recipe, RecipeScore
+
+ACTIVITY_WEIGHTS = {
+    Favorite: 1.0,
+    Cart: 2.0,
+}
+POPULAR_HALF_LIFE = getattr(settings, 'RECIPE_POPULAR_HALF_LIFE', 30)
+TRENDING_HALF_LIFE = getattr(settings, 'RECIPE_TRENDING_HALF_LIFE', 2)
+TRENDING_WINDOW = getattr(settings, 'RECIPE_TRENDING_WINDOW', 7)
+BATCH_SIZE = 1000
+
+
+def compute(now=None):
+    """Return {recipe_id: (popular, trending)} for recipes with activity.
+    Half-lives and trending window are in days."""
+    today = timezone.localdate(now)
+    scores = defaultdict(lambda: [0.0, 0.0])
+    for model, weight in ACTIVITY_WEIGHTS.items():
+        activity = (model.objects.order_by()
+                    .annotate(day=TruncDate('created'))
+                    .values('recipe_id', 'day').annotate(total=Count('pk')))
+        for row in activity.iterator():
+            age = max((today - row['day']).days, 0)
+            activity_weight = weight * row['total']
+            score = scores[row['recipe_id']]
+            score[0] += activity_weight * 0.5 ** (age / POPULAR_HALF_LIFE)
+            if age < TRENDING_WINDOW:
+                score[1] += activity_weight * 0.5 ** (age
+                                                      / TRENDING_HALF_LIFE)
+    return {recipe_id: tuple(score) for recipe_id, score in scores.items()}
+
+
+def rebuild(now=None):
+    """Recompute scores of all recipes. Return number of scored recipes."""
+    now = now or timezone.now()
+    scores = compute(now)
+    with transaction.atomic():
+        RecipeScore.objects.bulk_create(
+            [RecipeScore(recipe_id=recipe_id, computed_at=now,
+                         popular=scores.get(recipe_id, (0, 0))[0],
+                         trending=scores.get(recipe_id, (0, 0))[1])
+             for recipe_id in Recipe.objects.order_by()
+             .values_list('pk', flat=True)],
+            batch_size=BATCH_SIZE,
+            update_conflicts=True,
+            unique_fields=['recipe'],
+            update_fields=['popular', 'trending', 'computed_at']
+        )
+        page_cache.invalidate()
+        versions.bump(versions.SCORES)
+    return len(scores)
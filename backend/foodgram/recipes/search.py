@@ -0,0 +1,97 @@
+"""Full-text search over recipe name and text.
+
+PostgreSQL keeps weighted tsvector of name and text built with Russian
+dictionary in Recipe.search_vector column (GIN index). Other databases
+(SQLite in tests and local runs) use FTS5 table keyed by recipe id.
+Both match all words of the query by prefix, so partially typed words
+are found the same way (PostgreSQL stems the prefixes). Both are
+maintained by signals on Recipe save and delete, reindex() rebuilds them
+after bulk writes.
+"""
+import re
+
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector)
+from django.db import connection
+from django.db.models import F, Value
+from django.db.models.expressions import RawSQL
+
+from .models import Recipe
+
+SEARCH_CONFIG = 'russian'
+FTS_TABLE = 'recipes_recipe_fts'
+FTS_WEIGHTS = (4.0, 1.0)
+
+
+def uses_tsvector():
+    return connection.vendor == 'postgresql'
+
+
+def search_vector():
+    return (SearchVector('name', weight='A', config=SEARCH_CONFIG)
+            + SearchVector('text', weight='B', config=SEARCH_CONFIG))
+
+
+def query_words(query):
+    """Return words of query, dropping operators of query syntaxes."""
+    return re.findall(r'\w+', query.lower())
+
+
+def fts_query(query):
+    """Return FTS5 query matching all words of query by prefix."""
+    return ' '.join(f'"{word}"*' for word in query_words(query))
+
+
+def ts_query(query):
+    """Return tsquery text matching all words of query by prefix."""
+    return ' & '.join(f'{word}:*' for word in query_words(query))
+
+
+def index_recipe(recipe):
+    if uses_tsvector():
+        Recipe.objects.filter(pk=recipe.pk).update(
+            search_vector=search_vector())
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT OR REPLACE INTO {FTS_TABLE} (rowid, name, text) '
+            f'VALUES (%s, %s, %s)', [recipe.pk, recipe.name, recipe.text])
+
+
+def unindex_recipe(recipe_id):
+    if uses_tsvector():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s',
+                       [recipe_id])
+
+
+def reindex():
+    """Rebuild search data of all recipes."""
+    if uses_tsvector():
+        Recipe.objects.update(search_vector=search_vector())
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        cursor.execute(f'INSERT INTO {FTS_TABLE} (rowid, name, text) '
+                       f'SELECT id, name, text FROM recipes_recipe')
+
+
+def search_recipes(queryset, query):
+    """Filter recipes matching query and annotate them with search_rank,
+    greater for more relevant recipes (name matches weigh more)."""
+    if not query_words(query):
+        return queryset.annotate(search_rank=Value(0.0)).none()
+    if uses_tsvector():
+        search_query = SearchQuery(ts_query(query), config=SEARCH_CONFIG,
+                                   search_type='raw')
+        return queryset.filter(search_vector=search_query).annotate(
+            search_rank=SearchRank(F('search_vector'), search_query))
+    match = fts_query(query)
+    weights = ', '.join(map(str, FTS_WEIGHTS))
+    return queryset.filter(pk__in=RawSQL(
+        f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [match]
+    )).annotate(search_rank=RawSQL(
+        f'SELECT -bm25({FTS_TABLE}, {weights}) FROM {FTS_TABLE} '
+        f'WHERE {FTS_TABLE} MATCH %s AND rowid = recipes_recipe.id', [match]
+    ))
@@ -0,0 +1,143 @@
+"""Maintenance of ShoppingListItem aggregate table.
+
+Every function must be called inside the transaction that changes
+Cart or IngredientRecipe rows, so the aggregate never diverges from
+the live aggregation of ingredients in users carts. Both transactions
+lock the recipe rows first (lock_recipes()): otherwise a cart change
+reads committed ingredients of a recipe while a concurrent ingredients
+change doesn't see the uncommitted Cart row, and neither applies the
+other's change.
+"""
+from django.db import connection
+from django.db.models import Case, F, Sum, Value, When
+from django.db.models.functions import Greatest
+
+from .models import Cart, IngredientRecipe, Recipe, ShoppingListItem
+
+UPSERT_BATCH_SIZE = 500
+
+
+def recipe_amounts(recipe_ids):
+    """Return {ingredient_id: amount} summed over given recipes."""
+    return dict(
+        IngredientRecipe.objects.filter(recipe_id__in=recipe_ids)
+        .values_list('ingredient_id').annotate(Sum('amount'))
+        .order_by()
+    )
+
+
+def lock_recipes(recipe_ids):
+    """Lock rows of recipes until the end of transaction, in order of ids
+    to avoid deadlocks. Return ids of existing recipes."""
+    return set(Recipe.objects.select_for_update().filter(pk__in=recipe_ids)
+               .order_by('pk').values_list('pk', flat=True))
+
+
+def _increment(user_ids, amounts):
+    """Add positive amounts to items of every user, creating missing items
+    with single INSERT ... ON CONFLICT DO UPDATE statement per batch."""
+    rows = [(user_id, ingredient_id, amount)
+            for user_id in user_ids
+            for ingredient_id, amount in amounts.items()]
+    if not rows:
+        return
+    quote = connection.ops.quote_name
+    table = quote(ShoppingListItem._meta.db_table)
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), UPSERT_BATCH_SIZE):
+            batch = rows[start:start + UPSERT_BATCH_SIZE]
+            placeholders = ', '.join(['(%s, %s, %s)'] * len(batch))
+            cursor.execute(
+                f'INSERT INTO {table} ({quote("user_id")}, '
+                f'{quote("ingredient_id")}, {quote("amount")}) '
+                f'VALUES {placeholders} '
+                f'ON CONFLICT ({quote("user_id")}, {quote("ingredient_id")}) '
+                f'DO UPDATE SET {quote("amount")} = '
+                f'{table}.{quote("amount")} + excluded.{quote("amount")}',
+                [value for row in batch for value in row]
+            )
+
+
+def _decrement(user_ids, amounts):
+    """Subtract amounts from items of every user and drop empty items."""
+    if not amounts or not user_ids:
+        return
+    items = ShoppingListItem.objects.filter(user_id__in=user_ids,
+                                            ingredient_id__in=amounts)
+    items.update(amount=Greatest(
+        F('amount') - Case(*(When(ingredient_id=ingredient_id,
+                                  then=Value(amount))
+                             for ingredient_id, amount in amounts.items())),
+        Value(0)
+    ))
+    items.filter(amount=0).delete()
+
+
+def apply_changes(user_ids, changes):
+    """Apply {ingredient_id: delta} changes to shopping lists of users."""
+    _increment(user_ids, {ingredient_id: delta
+                          for ingredient_id, delta in changes.items()
+                          if delta > 0})
+    _decrement(user_ids, {ingredient_id: -delta
+                          for ingredient_id, delta in changes.items()
+                          if delta < 0})
+
+
+def add_recipes(user_id, recipe_ids):
+    """Recipes were added to user cart."""
+    _increment([user_id], recipe_amounts(recipe_ids))
+
+
+def remove_recipes(user_id, recipe_ids):
+    """Recipes were removed from user cart."""
+    _decrement([user_id], recipe_amounts(recipe_ids))
+
+
+def change_recipe(recipe_id, changes):
+    """Ingredients of recipe were changed by {ingredient_id: delta}."""
+    changes = {ingredient_id: delta
+               for ingredient_id, delta in changes.items() if delta}
+    if changes:
+        apply_changes(
+            list(Cart.objects.filter(recipe_id=recipe_id)
+                 .values_list('user_id', flat=True)),
+            changes
+        )
+
+
+def delete_recipe(recipe_id):
+    """Recipe is about to be deleted with its Cart rows."""
+    change_recipe(recipe_id, {ingredient_id: -amount for ingredient_id, amount
+                              in recipe_amounts([recipe_id]).items()})
+
+
+def live_items():
+    """Return {(user_id, ingredient_id): amount} computed from carts."""
+    return {
+        (user_id, ingredient_id): amount
+        for user_id, ingredient_id, amount in
+        IngredientRecipe.objects.filter(recipe__in_cart__isnull=False)
+        .values_list('recipe__in_cart__user', 'ingredient_id')
+        .annotate(Sum('amount')).order_by()
+    }
+
+
+def stored_items():
+    """Return {(user_id, ingredient_id): amount} from aggregate table."""
+    return {
+        (user_id, ingredient_id): amount
+        for user_id, ingredient_id, amount in
+        ShoppingListItem.objects.values_list('user_id', 'ingredient_id',
+                                             'amount')
+    }
+
+
+def rebuild():
+    """Recreate aggregate table from carts. Call inside transaction."""
+    ShoppingListItem.objects.all().delete()
+    ShoppingListItem.objects.bulk_create(
+        (ShoppingListItem(user_id=user_id, ingredient_id=ingredient_id,
+                          amount=amount)
+         for (user_id, ingredient_id), amount in live_items().items()),
+        batch_size=UPSERT_BATCH_SIZE
+    )
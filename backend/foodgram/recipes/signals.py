@@ -0,0 +1,191 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete)
+from django.dispatch import receiver
+
+from users.models import Follow
+
+from . import (counters, facets, fragments, page_cache, recipe_rows, search,
+               shopping_list, tag_map, tag_mask, timeline, user_state,
+               versions)
+from .ingredient_index import ingredient_index
+from .models import (Cart, Favorite, Ingredient, IngredientRecipe, Recipe,
+                     RecipeScore, Tag, TagRecipe)
+from .recipe_matcher import recipe_matcher
+
+User = get_user_model()
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_ingredient_index(**kwargs):
+    ingredient_index.invalidate()
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def invalidate_tag_map(**kwargs):
+    tag_map.invalidate()
+
+
+@receiver(post_delete, sender=Recipe)
+def invalidate_recipe_matcher(**kwargs):
+    """Bulk writes of recipe ingredients invalidate the matcher
+    in CreateRecipeSerializer."""
+    recipe_matcher.invalidate()
+
+
+@receiver(pre_delete, sender=Recipe)
+def remove_recipe_from_shopping_lists(instance, **kwargs):
+    shopping_list.delete_recipe(instance.pk)
+
+
+@receiver(pre_delete, sender=Recipe)
+def bump_users_versions(instance, **kwargs):
+    for model in (Favorite, Cart):
+        user_state.bump_version(
+            model, model.objects.filter(recipe=instance).values('user'))
+
+
+@receiver(post_save, sender=Recipe)
+def increment_recipes_count(instance, created, **kwargs):
+    if created:
+        counters.recipes_count_changed([instance.author_id], 1)
+
+
+@receiver(post_save, sender=Recipe)
+def create_recipe_score(instance, created, **kwargs):
+    """New recipe is ranked with zero score until the next recompute."""
+    if created:
+        RecipeScore.objects.create(recipe=instance)
+
+
+@receiver(post_save, sender=Recipe)
+def fan_out_recipe(instance, created, **kwargs):
+    """Timeline entries of the recipe are deleted with it by cascade."""
+    if created:
+        timeline.fan_out(instance)
+
+
+@receiver(pre_delete, sender=Recipe)
+def decrement_recipes_count(instance, **kwargs):
+    counters.recipes_count_changed([instance.author_id], -1)
+
+
+@receiver(pre_delete, sender=User)
+def decrement_user_rows_counters(instance, **kwargs):
+    """Cascade delete of user rows bypasses the views hooks."""
+    counters.followers_changed(
+        Follow.objects.filter(user=instance).values('author'), -1)
+    for model in (Favorite, Cart):
+        counters.recipes_changed(
+            model, model.objects.filter(user=instance).values('recipe'), -1)
+
+
+@receiver(post_save, sender=Recipe)
+def index_recipe(instance, **kwargs):
+    search.index_recipe(instance)
+
+
+@receiver(post_delete, sender=Recipe)
+def unindex_recipe(instance, **kwargs):
+    search.unindex_recipe(instance.pk)
+
+
+@receiver(pre_delete, sender=Tag)
+def clear_tag_bit(instance, **kwargs):
+    tag_mask.clear_tag(instance.pk)
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+@receiver((post_save, post_delete), sender=Tag)
+def invalidate_facets(**kwargs):
+    """Facets are dropped after commit, otherwise concurrent requests
+    could cache counts of old data under the new generation."""
+    transaction.on_commit(facets.invalidate)
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def invalidate_recipe_fragment(instance, **kwargs):
+    fragments.invalidate([instance.pk])
+
+
+@receiver(post_save, sender=User)
+def invalidate_author_fragments(instance, created, update_fields,
+                                **kwargs):
+    """Fragments and anonymous pages embed the author. Login saves only
+    last_login, which is not rendered."""
+    if created or (update_fields is not None
+                   and not fragments.AUTHOR_FIELDS & set(update_fields)):
+        return
+    fragments.invalidate(
+        Recipe.objects.filter(author=instance).values_list('pk', flat=True))
+    page_cache.invalidate()
+
+
+@receiver((post_save, post_delete), sender=Tag)
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_all_fragments(**kwargs):
+    fragments.invalidate_all()
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+@receiver((post_save, post_delete), sender=Tag)
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_anonymous_pages(**kwargs):
+    page_cache.invalidate()
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def bump_tags_version(**kwargs):
+    versions.bump(versions.TAGS)
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def bump_ingredients_version(**kwargs):
+    versions.bump(versions.INGREDIENTS)
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def bump_recipes_version(**kwargs):
+    """updated_at is set on save, not on commit: a recipe committed after
+    a newer one doesn't move the last update of recipes."""
+    versions.bump(versions.RECIPES)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def bump_users_version(update_fields=None, **kwargs):
+    if (update_fields is not None
+            and not fragments.AUTHOR_FIELDS & set(update_fields)):
+        return
+    versions.bump(versions.USERS)
+
+
+@receiver((post_save, post_delete), sender=IngredientRecipe)
+@receiver((post_save, post_delete), sender=TagRecipe)
+def collect_recipe_rows(sender, instance, **kwargs):
+    """Rows written outside of the recipe save are handled once per
+    transaction. Bulk writes of CreateRecipeSerializer go with the recipe
+    save (setting tags mask) and send no signals."""
+    recipe_rows.changed([instance.recipe_id], tags=sender is TagRecipe)
+
+
+@receiver(post_delete, sender=Recipe)
+def discard_recipe_rows(instance, **kwargs):
+    """Cascade deletes rows of the recipe before it."""
+    recipe_rows.deleted([instance.pk])
+
+
+@receiver(m2m_changed, sender=IngredientRecipe)
+@receiver(m2m_changed, sender=TagRecipe)
+def collect_m2m_recipe_rows(sender, instance, action, reverse, pk_set,
+                            **kwargs):
+    """Rows written by recipe.tags and tag.recipes managers (same for
+    ingredients). Reverse clear doesn't pass pk_set."""
+    tags = sender is TagRecipe
+    if action in ('post_add', 'post_remove'):
+        recipe_rows.changed(pk_set if reverse else [instance.pk], tags)
+    elif action == 'pre_clear':
+        recipe_rows.changed(
+            instance.recipes.values_list('pk', flat=True) if reverse
+            else [instance.pk], tags)
@@ -0,0 +1,27 @@
+"""Cached map of tag slugs to ids.
+
+Tags are few and rarely change, so filters validate and resolve slugs
+from the cache instead of querying Tag table. The map is dropped on Tag
+writes and expires after TAG_MAP_TTL seconds (to pick up writes which
+send no signals).
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Tag
+
+TAG_MAP_KEY = 'recipes:tag-map'
+TAG_MAP_TTL = getattr(settings, 'TAG_MAP_TTL', 300)
+
+
+def get_tag_map():
+    """Return {slug: id} of all tags."""
+    return cache.get_or_set(
+        TAG_MAP_KEY,
+        lambda: dict(Tag.objects.values_list('slug', 'id')),
+        TAG_MAP_TTL
+    )
+
+
+def invalidate():
+    cache.delete(TAG_MAP_KEY)
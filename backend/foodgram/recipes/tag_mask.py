@@ -0,0 +1,81 @@
+"""Tag bitmask of recipes.
+
+Tag with id N (1 <= N <= MASK_WIDTH) owns bit N - 1 of Recipe.tags_mask,
+so tags filter is a bitwise AND on the recipe row instead of a lookup
+through TagRecipe. Filters by tags without a bit fall back to EXISTS
+over TagRecipe. The mask is set by CreateRecipeSerializer, refreshed
+after commit of other TagRecipe writes (see recipe_rows) and cleared on
+Tag delete. The mask column has no index: bitwise AND can't use it.
+"""
+from django.db.models import Exists, F, OuterRef
+from django.db.models.lookups import GreaterThan
+
+from .models import Recipe, TagRecipe
+
+MASK_WIDTH = 63
+BATCH_SIZE = 1000
+
+
+def tag_bit(tag_id):
+    """Return bit of tag or 0 for tags beyond the mask width."""
+    return 1 << (tag_id - 1) if 0 < tag_id <= MASK_WIDTH else 0
+
+
+def mask_of(tag_ids):
+    mask = 0
+    for tag_id in tag_ids:
+        mask |= tag_bit(tag_id)
+    return mask
+
+
+def refresh(recipe_ids):
+    """Recompute masks of recipes from TagRecipe rows."""
+    masks = dict.fromkeys(recipe_ids, 0)
+    for recipe_id, tag_id in TagRecipe.objects.filter(
+            recipe_id__in=masks).values_list('recipe_id', 'tag_id'):
+        masks[recipe_id] |= tag_bit(tag_id)
+    Recipe.objects.bulk_update(
+        [Recipe(pk=recipe_id, tags_mask=mask)
+         for recipe_id, mask in masks.items()],
+        ['tags_mask'], batch_size=BATCH_SIZE
+    )
+
+
+def rebuild():
+    """Recompute masks of all recipes."""
+    refresh(list(Recipe.objects.values_list('pk', flat=True)))
+
+
+def clear_tag(tag_id):
+    """Remove bit of tag from masks of its recipes."""
+    bit = tag_bit(tag_id)
+    if bit:
+        Recipe.objects.filter(recipe_tags__tag_id=tag_id).update(
+            tags_mask=F('tags_mask').bitand(~bit))
+
+
+def has_tag(tag_id):
+    """Return condition of recipe having the tag."""
+    bit = tag_bit(tag_id)
+    if bit:
+        return GreaterThan(F('tags_mask').bitand(bit), 0)
+    return Exists(TagRecipe.objects.filter(recipe=OuterRef('pk'),
+                                           tag_id=tag_id))
+
+
+def filter_by_mask(queryset, tag_ids):
+    return queryset.alias(
+        tag_bits=F('tags_mask').bitand(mask_of(tag_ids))
+    ).filter(tag_bits__gt=0)
+
+
+def filter_by_join(queryset, tag_ids):
+    return queryset.filter(Exists(TagRecipe.objects.filter(
+        recipe=OuterRef('pk'), tag_id__in=tag_ids)))
+
+
+def filter_by_tags(queryset, tag_ids):
+    """Recipes with any of the tags."""
+    if all(map(tag_bit, tag_ids)):
+        return filter_by_mask(queryset, tag_ids)
+    return filter_by_join(queryset, tag_ids)
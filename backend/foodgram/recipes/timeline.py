@@ -0,0 +1,134 @@
+"""Subscription feed of recipes by followed authors.
+
+Recipes are fanned out on write: a new recipe is inserted into timelines
+of all followers of its author in chunks, subscribing copies the author
+recipes into the timeline and unsubscribing removes them. Delivery mode
+is stored per author (User.timeline_fanout): an author reaching
+TIMELINE_FANOUT_THRESHOLD followers is switched to fan-out-on-read, its
+recipes are no longer fanned out and the feed reads them from Recipe
+table instead. The author keeps entries written before and stays read
+on feed requests when followers drop below the threshold, so no recipes
+go missing. rebuild() realigns modes and timelines with the current
+follower counts.
+Entries copy pub_date of the recipe, so feed pages are keyset scans of
+the user timeline index merged with recipes of fan-out-on-read authors.
+"""
+from heapq import merge
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from users.models import Follow, User
+
+from .models import Recipe, TimelineEntry
+
+FANOUT_THRESHOLD = getattr(settings, 'TIMELINE_FANOUT_THRESHOLD', 1000)
+CHUNK_SIZE = 1000
+
+
+def _insert(entries):
+    """Bulk insert entries in chunks, skipping existing ones."""
+    entries = iter(entries)
+    while batch := list(islice(entries, CHUNK_SIZE)):
+        TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def fan_out(recipe):
+    """Insert new recipe into timelines of the author followers."""
+    if not recipe.author.timeline_fanout:
+        return
+    followers = Follow.objects.filter(author_id=recipe.author_id).values_list(
+        'user_id', flat=True)
+    _insert(TimelineEntry(user_id=user_id, recipe_id=recipe.pk,
+                          author_id=recipe.author_id,
+                          pub_date=recipe.pub_date)
+            for user_id in followers.iterator(chunk_size=CHUNK_SIZE))
+
+
+def backfill(user_id, author):
+    """Insert recipes of newly followed author into user timeline. Author
+    with current followers_count reaching the threshold is switched
+    to fan-out-on-read instead."""
+    if not author.timeline_fanout:
+        return
+    if author.followers_count >= FANOUT_THRESHOLD:
+        User.objects.filter(pk=author.pk).update(timeline_fanout=False)
+        author.timeline_fanout = False
+        return
+    recipes = Recipe.objects.filter(author=author).order_by().values_list(
+        'pk', 'pub_date')
+    _insert(TimelineEntry(user_id=user_id, recipe_id=recipe_id,
+                          author_id=author.pk, pub_date=pub_date)
+            for recipe_id, pub_date in recipes.iterator(
+                chunk_size=CHUNK_SIZE))
+
+
+def trim(user_id, author_id):
+    """Remove recipes of unfollowed author from user timeline."""
+    TimelineEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def rebuild():
+    """Set delivery modes of authors by follower counts and refill all
+    timelines from subscriptions."""
+    with transaction.atomic():
+        User.objects.filter(followers_count__lt=FANOUT_THRESHOLD).update(
+            timeline_fanout=True)
+        User.objects.filter(followers_count__gte=FANOUT_THRESHOLD).update(
+            timeline_fanout=False)
+        TimelineEntry.objects.all().delete()
+        follows = Follow.objects.filter(
+            author__timeline_fanout=True
+        ).order_by('author').values_list('user_id', 'author_id')
+        recipes = {}
+        for author_id, recipe_id, pub_date in Recipe.objects.filter(
+                author__timeline_fanout=True
+        ).order_by().values_list('author_id', 'pk', 'pub_date').iterator():
+            recipes.setdefault(author_id, []).append((recipe_id, pub_date))
+        _insert(TimelineEntry(user_id=user_id, recipe_id=recipe_id,
+                              author_id=author_id, pub_date=pub_date)
+                for user_id, author_id in follows.iterator()
+                for recipe_id, pub_date in recipes.get(author_id, ()))
+
+
+def _keyset_page(queryset, pk_field, position, reverse, limit):
+    """Return up to limit (pub_date, pk) rows of queryset after position,
+    newest first or oldest first if reverse."""
+    if position is not None:
+        pub_date, pk = position
+        lookup = 'gt' if reverse else 'lt'
+        queryset = queryset.filter(
+            Q(**{f'pub_date__{lookup}': pub_date})
+            | Q(pub_date=pub_date, **{f'{pk_field}__{lookup}': pk})
+        )
+    if reverse:
+        ordering = ('pub_date', pk_field)
+    else:
+        ordering = ('-pub_date', f'-{pk_field}')
+    return queryset.order_by(*ordering).values_list(
+        'pub_date', pk_field)[:limit]
+
+
+def feed(user, position, reverse, limit):
+    """Return up to limit (pub_date, recipe id) positions of the user feed
+    after position, newest first or oldest first if reverse.
+    Both sources are read up to limit rows, so recipes of authors switched
+    to fan-out-on-read and found in both are merged without gaps."""
+    entries = _keyset_page(TimelineEntry.objects.filter(user=user),
+                           'recipe_id', position, reverse, limit)
+    recipes = _keyset_page(
+        Recipe.objects.filter(author__in=Follow.objects.filter(
+            user=user, author__timeline_fanout=False
+        ).values('author')),
+        'pk', position, reverse, limit
+    )
+    page = []
+    for row in merge(entries, recipes, reverse=not reverse):
+        if page and page[-1] == row:
+            continue
+        page.append(row)
+        if len(page) == limit:
+            break
+    return page
@@ -0,0 +1,32 @@
+"""Per-user version counters of favorites, shopping cart and follows.
+
+Counters are bumped in the transaction that changes Favorite, Cart or
+Follow rows of the user and serve as validators (ETag) for the recipe id
+sets of the user and the flags rendered for the user. Only the row of
+the user is locked, so writes of different users don't wait for each
+other.
+"""
+from django.contrib.auth import get_user_model
+from django.db.models import F
+
+from users.models import Follow
+
+from .models import Cart, Favorite
+
+User = get_user_model()
+
+VERSION_FIELDS = {
+    Favorite: 'favorites_version',
+    Cart: 'cart_version',
+    Follow: 'follows_version',
+}
+
+
+def bump_version(model, users):
+    """Increment version of model rows for users (queryset or ids)."""
+    field = VERSION_FIELDS[model]
+    User.objects.filter(pk__in=users).update(**{field: F(field) + 1})
+
+
+def get_version(model, user):
+    return getattr(user, VERSION_FIELDS[model])
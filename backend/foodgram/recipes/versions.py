@@ -0,0 +1,49 @@
+"""Per-table version counters.
+
+Counters of tables rendered inside API resources (tags, ingredients,
+users, recipe scores) and of recipe writes are bumped after commit of
+the write, so the shared counter row is locked for a single statement,
+not for the whole write transaction. Together with Recipe.updated_at
+and per-user counters of users.User they are validators of conditional
+GET, read without touching the tables.
+"""
+from django.db import transaction
+from django.db.models import DateTimeField, F, Value
+from django.utils import timezone
+
+from .models import TableVersion
+
+INGREDIENTS = 'ingredients'
+RECIPES = 'recipes'
+SCORES = 'scores'
+TAGS = 'tags'
+USERS = 'users'
+
+
+def bump(table):
+    transaction.on_commit(lambda: _increment(table))
+
+
+def _increment(table):
+    if not TableVersion.objects.filter(table=table).update(
+            version=F('version') + 1, updated_at=timezone.now()):
+        TableVersion.objects.get_or_create(table=table,
+                                           defaults={'version': 1})
+
+
+def get_versions(tables, resource_updated_at=None):
+    """Return {table: version} of tables, the last time any of them was
+    bumped and value of resource_updated_at expression (subquery of
+    update time of a resource) read with the same query."""
+    if resource_updated_at is None:
+        resource_updated_at = Value(None, output_field=DateTimeField())
+    rows = TableVersion.objects.filter(table__in=tables).annotate(
+        resource_updated_at=resource_updated_at)
+    versions = {table: 0 for table in tables}
+    tables_updated_at = resource = None
+    for row in rows:
+        versions[row.table] = row.version
+        tables_updated_at = max(filter(None, (tables_updated_at,
+                                              row.updated_at)))
+        resource = row.resource_updated_at
+    return versions, tables_updated_at, resource
@@ -1,6 +1,8 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 
+from core.admin import ReadOnlyAdmin
+
 from .models import Follow, User
 
 
@@ -40,4 +42,4 @@ class CustomUserAdmin(UserAdmin):    # pragma: no cover
         return form
 
 
-admin.site.register(Follow)
+admin.site.register(Follow, ReadOnlyAdmin)
@@ -0,0 +1,23 @@
+# Generated by Django 4.1.7 on 2026-10-17 06:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='cart_version',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Версия корзины'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='favorites_version',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Версия избранного'),
+        ),
+    ]
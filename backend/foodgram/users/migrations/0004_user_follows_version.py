@@ -0,0 +1,18 @@
+# Generated by Django 4.1.7 on 2026-10-17 07:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_user_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='follows_version',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Версия подписок'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.1.7 on 2026-10-17 09:12
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_timeline_fanout(apps, schema_editor):
+    User = apps.get_model('users', 'User')
+    threshold = getattr(settings, 'TIMELINE_FANOUT_THRESHOLD', 1000)
+    User.objects.filter(followers_count__gte=threshold).update(
+        timeline_fanout=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_user_follows_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='timeline_fanout',
+            field=models.BooleanField(default=True, editable=False, verbose_name='Рассылка рецептов в ленты подписчиков'),
+        ),
+        migrations.RunPython(fill_timeline_fanout, migrations.RunPython.noop),
+    ]
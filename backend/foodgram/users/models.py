@@ -8,6 +8,19 @@ class User(AbstractUser):
     first_name = models.CharField('Имя', max_length=150)
     last_name = models.CharField('Фамилия', max_length=150)
     email = models.EmailField('Email-адрес', unique=True, max_length=254)
+    favorites_version = models.PositiveIntegerField(
+        'Версия избранного', default=0, editable=False)
+    cart_version = models.PositiveIntegerField(
+        'Версия корзины', default=0, editable=False)
+    follows_version = models.PositiveIntegerField(
+        'Версия подписок', default=0, editable=False)
+    recipes_count = models.PositiveIntegerField(
+        'Количество рецептов', default=0, editable=False)
+    followers_count = models.PositiveIntegerField(
+        'Количество подписчиков', default=0, editable=False)
+    timeline_fanout = models.BooleanField(
+        'Рассылка рецептов в ленты подписчиков', default=True,
+        editable=False)
 
     class Meta(AbstractUser.Meta):
         verbose_name = 'Пользователь'